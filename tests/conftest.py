@@ -0,0 +1,108 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def wangye():
+    """导入 wangye 模块（模块导入时会按当前目录加载参考数据，需在仓库根目录下导入）"""
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+    try:
+        module = importlib.import_module("wangye")
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+@pytest.fixture(scope="session")
+def xueyeqiao(wangye):
+    """学业桥处理模块（参考数据已由 wangye 导入时设置）"""
+    return importlib.import_module("xueyeqiao")
+
+
+@pytest.fixture
+def image_server():
+    """
+    本地图片网页：/page 中依次为 3 张延迟不同的 PNG（靠前的响应更慢）、1 个 404、1 个 data: 图片、
+    1 张首次请求返回 503 的 PNG。图片带 ETag，条件请求命中时返回 304；记录每次请求及最大并发数。
+    """
+    import hashlib
+    import io
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from PIL import Image
+
+    images = {}
+    for i, (size, delay) in enumerate([(30, 0.3), (40, 0.1), (50, 0.0)], 1):
+        buffer = io.BytesIO()
+        Image.new('RGB', (size, size), (i * 60, 0, 0)).save(buffer, format='PNG')
+        images[f'/a{i}.png'] = (buffer.getvalue(), delay)
+    images['/flaky.png'] = (images['/a1.png'][0], 0.0)
+    page = ('<img src="/a1.png"><img src="/a2.png"><img src="/a3.png"><img src="/missing.png">'
+            '<img src="data:image/png;base64,AAAA"><img src="/flaky.png">')
+    state = {'requests': [], 'active': 0, 'max_active': 0, 'flaky_hits': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                state['requests'].append((self.path, self.headers.get('If-None-Match')))
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+            try:
+                self.handle_path()
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+        def handle_path(self):
+            if self.path == '/page':
+                return self.reply(200, 'text/html', page.encode('utf-8'))
+            if self.path not in images:
+                return self.reply(404, 'text/plain', b'not found')
+            if self.path == '/flaky.png':
+                with lock:
+                    state['flaky_hits'] += 1
+                    first = state['flaky_hits'] == 1
+                if first:
+                    return self.reply(503, 'text/plain', b'busy')
+            data, delay = images[self.path]
+            time.sleep(delay)
+            etag = '"%s"' % hashlib.md5(data).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                return self.reply(304, None, b'', etag)
+            self.reply(200, 'image/png', data, etag)
+
+        def reply(self, code, content_type, body, etag=None):
+            self.send_response(code)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if etag:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f"http://127.0.0.1:{server.server_address[1]}/page"
+    state['images'] = {path: data for path, (data, _) in images.items()}
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,241 @@
+import io
+import os
+
+import pandas as pd
+
+
+def test_college_score_format_with_shuffled_index(wangye):
+    records = [
+        {'学校': 'A大学', '省份': '北京', '层次': '本科', '科类': '物理类', '批次': '本科批', '专业组代码': '01', '招生代码': '1001', '招生人数': 1},
+        {'学校': 'A大学', '省份': '北京', '层次': '本科', '科类': '物理类', '批次': '本科批', '专业组代码': '01', '招生代码': '1001', '招生人数': 2},
+        {'学校': 'B学院', '省份': '北京', '层次': '本科', '科类': '历史类', '批次': '本科批', '专业组代码': '02', '招生代码': '2002', '招生人数': 10},
+        {'学校': 'C学院', '省份': '河北', '层次': '本科', '科类': '物理类', '批次': '本科批', '专业组代码': '03', '招生代码': '3003', '招生人数': 7},
+    ]
+    plan = pd.DataFrame(records, index=[10, 20, 30, 40])
+    expected = wangye.convert_to_college_score_format(records)
+    for order in ([30, 10, 40, 20], [40, 30, 20, 10]):
+        shuffled = plan.loc[order]
+        result = wangye.convert_to_college_score_format(shuffled)
+        by_school = {row['学校名称']: row['招生人数'] for row in result}
+        assert by_school == {'A大学': '3', 'B学院': '10', 'C学院': '7'}
+        assert sorted(result, key=lambda r: r['学校名称']) == sorted(expected, key=lambda r: r['学校名称'])
+
+
+def test_typo_fixes_are_chained_in_dict_order(xueyeqiao):
+    cases = {
+        '5十31体化': ('5+3一体化', ["错别字：'5十3'→'5+3'", "错别字：'5+31体化'→'5+3一体化'"]),
+        '5十3体化': ('5+3一体化', ["错别字：'5十3'→'5+3'", "错别字：'5+3体化'→'5+3一体化'"]),
+        '色言色弱申报': ('色盲色弱慎报', ["错别字：'色言'→'色盲'", "错别字：'色盲色弱申报'→'色盲色弱慎报'"]),
+        '色育色弱申报': ('色盲色弱慎报', ["错别字：'色育'→'色盲'", "错别字：'色盲色弱申报'→'色盲色弱慎报'"]),
+        '色自色弱申报': ('色盲色弱慎报', ["错别字：'色自'→'色盲'", "错别字：'色盲色弱申报'→'色盲色弱慎报'"]),
+    }
+    for text, (fixed, typo_issues) in cases.items():
+        result, issues = xueyeqiao._analyze_and_fix(text)
+        assert result == fixed
+        assert [issue for issue in issues if issue.startswith('错别字')] == typo_issues
+
+
+def test_plan_match_not_reused_for_different_plan_with_same_row_count(wangye):
+    college = pd.DataFrame([
+        {'省份': '北京', '学校': 'A大学', '科类': '物理类', '批次': '本科批', '专业组代码': '01', '招生代码': '1001'},
+    ])
+    college_index = wangye.build_plan_key_index(college, 'college')
+    plan_a = pd.DataFrame([
+        {'省份': '北京', '学校': 'A大学', '科类': '物理类', '批次': '本科批', '专业组代码': '01', '招生代码': '1001'},
+        {'省份': '北京', '学校': 'B学院', '科类': '物理类', '批次': '本科批', '专业组代码': '02', '招生代码': '2002'},
+    ])
+    plan_b = pd.DataFrame([
+        {'省份': '河北', '学校': 'C学院', '科类': '历史类', '批次': '本科批', '专业组代码': '03', '招生代码': '3003'},
+        {'省份': '北京', '学校': 'A大学', '科类': '物理类', '批次': '本科批', '专业组代码': '01', '招生代码': '1001'},
+    ])
+    match = wangye.match_plan_keys(plan_a, college_index, wangye.PLAN_COLLEGE_KEY_FIELDS, 'digest-a')
+    assert 'keys' not in match
+    assert wangye.is_plan_match_current(match, plan_a, college_index, wangye.PLAN_COLLEGE_KEY_FIELDS, 'digest-a')
+    assert not wangye.is_plan_match_current(match, plan_b, college_index, wangye.PLAN_COLLEGE_KEY_FIELDS, 'digest-b')
+    assert not wangye.is_plan_match_current(match, plan_b, college_index, wangye.PLAN_COLLEGE_KEY_FIELDS)
+
+    unmatched = wangye.filter_unmatched_plan_data_for_college_export(plan_b, college_index, match, 'digest-b')
+    assert isinstance(unmatched, pd.DataFrame)
+    assert unmatched['学校'].tolist() == ['C学院']
+
+
+def test_reference_snapshots_are_kept_per_column(wangye, tmp_path, monkeypatch):
+    workbook = tmp_path / "reference.xlsx"
+    pd.DataFrame({'学校名称': ['A大学', ' B学院 '], '省份': ['北京', '河北']}).to_excel(workbook, index=False)
+    signature = wangye._reference_file_signature(str(workbook))
+    schools = wangye._load_reference_set.__wrapped__(str(workbook), '学校名称', signature)
+    provinces = wangye._load_reference_set.__wrapped__(str(workbook), '省份', signature)
+    assert schools == frozenset({'A大学', 'B学院'})
+    assert provinces == frozenset({'北京', '河北'})
+
+    # 两列的快照都已写入，再次加载直接读取快照，不再解析 xlsx
+    def fail_read_excel(*args, **kwargs):
+        raise AssertionError("snapshot was not used")
+
+    monkeypatch.setattr(wangye.pd, 'read_excel', fail_read_excel)
+    assert wangye._load_reference_set.__wrapped__(str(workbook), '学校名称', signature) == schools
+    assert wangye._load_reference_set.__wrapped__(str(workbook), '省份', signature) == provinces
+
+
+def test_template_numeric_columns_tolerate_blank_and_text(wangye, tmp_path):
+    import openpyxl
+
+    data = pd.DataFrame({'名称': ['a', 'b', 'c', 'd'], '人数': [3, '', '待定', None]})
+    output = tmp_path / "numeric.xlsx"
+    wangye.write_template_workbook(str(output), data, {
+        'note': '备注',
+        'header_rows': [['招生年', 2025]],
+        'columns': ['名称', '人数'],
+        'numeric_columns': ['人数'],
+    })
+    ws = openpyxl.load_workbook(output).active
+    assert [ws.cell(row=r, column=2).value for r in range(4, 8)] == [3, 0, '待定', 0]
+
+
+def test_plan_key_index_is_versioned_and_pruned(wangye, tmp_path, monkeypatch):
+    index_dir = tmp_path / "index"
+    monkeypatch.setattr(wangye, 'PLAN_KEY_INDEX_DIR', str(index_dir))
+    df = pd.DataFrame({field: ['x', 'x', 'y'] for field in wangye.PLAN_KEY_INDEX_FIELDS['college']})
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+
+    index = wangye._load_plan_key_index.__wrapped__('college', 'digest-a', buffer.getvalue())
+    assert set(index) == {'kind', 'keys', 'row_count'}
+    assert len(index['keys']) == 2 and index['row_count'] == 3
+
+    # 组合键规则版本变化后，旧索引不再命中
+    def fail_read_excel(*args, **kwargs):
+        raise AssertionError("index was not used")
+
+    with monkeypatch.context() as m:
+        m.setattr(wangye.pd, 'read_excel', fail_read_excel)
+        assert wangye._load_plan_key_index.__wrapped__('college', 'digest-a', b'')['row_count'] == 3
+    monkeypatch.setattr(wangye, 'PLAN_KEY_INDEX_VERSION', wangye.PLAN_KEY_INDEX_VERSION + 1)
+    assert wangye._load_plan_key_index.__wrapped__('college', 'digest-a', buffer.getvalue())['row_count'] == 3
+
+    # 超过容量上限时按最近使用时间淘汰，只保留最新写入的索引
+    first = index_dir / "college-digest-a.pkl"
+    os.utime(first, (1, 1))
+    monkeypatch.setattr(wangye, 'PLAN_KEY_INDEX_MAX_BYTES', first.stat().st_size)
+    wangye._load_plan_key_index.__wrapped__('college', 'digest-b', buffer.getvalue())
+    assert sorted(p.name for p in index_dir.iterdir()) == ["college-digest-b.pkl"]
+
+
+def test_image_thumbnail_is_keyed_on_download_digest(wangye, image_server, tmp_path, monkeypatch):
+    import hashlib
+
+    cache_dir = str(tmp_path / "cache")
+    first = wangye.fetch_images_static(image_server['url'], str(tmp_path / "run1"), cache_dir=cache_dir)
+    second = wangye.fetch_images_static(image_server['url'], str(tmp_path / "run2"), cache_dir=cache_dir)
+    # 下载（200 或 304）时即返回内容哈希，与缓存内容文件名一致
+    assert first[0][1] == second[0][1] == hashlib.sha256(image_server['images']['/a1.png']).hexdigest()
+
+    # 第二次抓取的图片位于新的临时目录，相同内容直接命中缓存
+    wangye.image_thumbnail.clear()
+    thumb = wangye.image_thumbnail(first[0][1], first[0][0])
+
+    def fail_open(*args, **kwargs):
+        raise AssertionError("thumbnail was decoded again")
+
+    monkeypatch.setattr(wangye.Image, 'open', fail_open)
+    assert wangye.image_thumbnail(second[0][1], second[0][0]) == thumb
+
+
+def test_segmentation_without_data_rows_skips_check_cells(wangye, tmp_path):
+    import openpyxl
+
+    workbook = tmp_path / "segment.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws['A2'], ws['B2'] = '年份', 2025
+    ws['A3'], ws['B3'] = '省份', '北京'
+    ws['A7'] = '分数'
+    wb.save(workbook)
+
+    output = wangye.process_segmentation_file(str(workbook))
+    ws = openpyxl.load_workbook(output).active
+    assert (ws['E7'].value, ws['F7'].value, ws['G2'].value) == ('累计人数校验结果', '分数校验结果', '√')
+    assert ws.max_row == 7
+    assert ws['E8'].value is None and ws['F8'].value is None
+
+
+def test_process_pool_does_not_rerun_main_script(xueyeqiao, tmp_path, monkeypatch):
+    import sys
+    import types
+
+    # 模拟 streamlit run：页面脚本作为 __main__，子进程若重新执行它就会留下标记文件
+    marker = tmp_path / "main-executed"
+    script = tmp_path / "page.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\n", encoding='utf-8')
+    page = types.ModuleType('__main__')
+    page.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, '__main__', page)
+    monkeypatch.setattr(xueyeqiao.os, 'cpu_count', lambda: 2)
+
+    df = pd.DataFrame({
+        '学校名称': ['北京大学', '不存在的学校'] * 600,
+        '专业备注': ['（中外合作办学', '色言色弱申报'] * 600,
+        '最高分': [600, 500] * 600,
+        '平均分': [590, 520] * 600,
+        '最低分': [580, 510] * 600,
+    })
+    expected = xueyeqiao.run_chunks(df.copy(), mode='serial')
+    result = xueyeqiao.run_chunks(df.copy(), mode='processes')
+    pd.testing.assert_frame_equal(result, expected)
+    assert not marker.exists()
+    assert sys.modules['__main__'] is page
+
+
+def test_college_score_export_accepts_unmatched_frame(wangye, tmp_path):
+    import openpyxl
+
+    plan = pd.DataFrame([
+        {'年份': 2025, '学校': 'A大学', '省份': '北京', '层次': '本科', '科类': '物理类', '批次': '本科批',
+         '专业组代码': '01', '招生代码': '1001', '招生人数': 3},
+        {'年份': 2025, '学校': 'A大学', '省份': '北京', '层次': '本科', '科类': '物理类', '批次': '本科批',
+         '专业组代码': '01', '招生代码': '1001', '招生人数': 2},
+    ], index=[7, 3])
+    from_frame, from_records = tmp_path / "frame.xlsx", tmp_path / "records.xlsx"
+    wangye.export_college_score_data_to_excel(wangye.convert_to_college_score_format(plan), plan, str(from_frame))
+    records = plan.to_dict('records')
+    wangye.export_college_score_data_to_excel(
+        wangye.convert_to_college_score_format(records), records, str(from_records))
+
+    frame_rows = list(openpyxl.load_workbook(from_frame).active.iter_rows(values_only=True))
+    assert frame_rows == list(openpyxl.load_workbook(from_records).active.iter_rows(values_only=True))
+    assert frame_rows[1][:2] == ('招生年', '2025')
+
+
+def test_fetch_images_keeps_page_order_and_skips_failures(wangye, image_server, tmp_path):
+    images = wangye.fetch_images_static(image_server['url'], str(tmp_path), workers=8, per_host=2, cache_dir=None)
+    paths = [path for path, _ in images]
+
+    # 第 4、5 个 img（404、data:）被跳过，其余按页面顺序返回，与下载完成的先后无关
+    assert [os.path.basename(path) for path in paths] == ['img_001.png', 'img_002.png', 'img_003.png', 'img_006.png']
+    with open(paths[0], 'rb') as f:
+        assert f.read() == image_server['images']['/a1.png']
+    # 503 按重试策略再次请求后成功；同一主机并发下载，且并发请求数不超过 per_host
+    assert image_server['flaky_hits'] == 2
+    assert image_server['max_active'] == 2
+
+
+def test_image_cache_revalidates_and_links_blobs(wangye, image_server, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = wangye.fetch_images_static(image_server['url'], str(tmp_path / "run1"), cache_dir=cache_dir)
+    image_server['requests'].clear()
+    second = wangye.fetch_images_static(image_server['url'], str(tmp_path / "run2"), cache_dir=cache_dir)
+
+    # 第二次抓取对已缓存的图片发条件请求（If-None-Match），服务端返回 304 后直接使用缓存内容
+    conditional = {path for path, etag in image_server['requests'] if etag}
+    assert conditional == {'/a1.png', '/a2.png', '/a3.png', '/flaky.png'}
+    assert [os.path.basename(path) for path, _ in second] == [os.path.basename(path) for path, _ in first]
+
+    # 图片内容只存一份：抓取结果是缓存内容的硬链接；a1 与 flaky 内容相同，共用同一份
+    blob_dir = os.path.join(cache_dir, 'blobs')
+    assert len(os.listdir(blob_dir)) == 3
+    for path, digest in second:
+        assert os.path.samefile(path, os.path.join(blob_dir, digest))
+
+    # 内容被淘汰后，指向它的 URL 记录一并删除
+    assert wangye.prune_image_cache(cache_dir, max_bytes=0) == 3
+    assert os.listdir(blob_dir) == [] and os.listdir(os.path.join(cache_dir, 'urls')) == []
@@ -1,23 +1,34 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import logging
+import pickle
 import re
+import hashlib
+import threading
 import streamlit.components.v1 as components
-from difflib import SequenceMatcher
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import openpyxl
 from openpyxl.styles import PatternFill, Alignment
 from openpyxl.styles import numbers
-import base64
+from openpyxl.cell import WriteOnlyCell
 import sys
 from io import BytesIO
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tempfile
+import shutil
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
 from PIL import Image
+import pymupdf
 import io
+import xueyeqiao
+from xueyeqiao import CHUNK_EXECUTOR_MODE, CHUNK_EXECUTOR_MODES, convert_selection_requirement_from_requirement, run_chunks
 
 # ============================
 # 初始化设置
@@ -47,62 +58,117 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 
+# ======== 参考数据加载（进程内缓存 + 本地快照） =========
+# Streamlit 每次交互都会重新执行整个脚本，参考数据按文件签名缓存，避免每次重新解析 xlsx
+REFERENCE_SNAPSHOT_SUFFIX = '.snapshot.pkl'
+# 参考数据列的规整方式（去空值、转字符串、去首尾空白）变化时递增，旧快照自动失效
+REFERENCE_SNAPSHOT_VERSION = 1
+
+
+def _reference_file_signature(path):
+    """参考数据文件签名（修改时间 + 文件大小），文件变化后缓存和快照自动失效"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_reference_snapshot(snapshot_path, signature, value_type=frozenset):
+    """读取与签名一致的快照，不存在或已过期时返回 None"""
+    try:
+        with open(snapshot_path, 'rb') as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(payload, dict) or payload.get('signature') != signature:
+        return None
+    values = payload.get('values')
+    return values if isinstance(values, value_type) else None
+
+
+def _write_reference_snapshot(snapshot_path, signature, values):
+    """写入快照（先写临时文件再替换，避免并发读到半个文件）；目录不可写时忽略"""
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'signature': signature, 'values': values}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        logging.warning(f"写入参考数据快照失败：{e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _reference_snapshot_path(path, column):
+    """快照文件按列区分：同一工作簿的不同列各有一份快照，互不覆盖"""
+    column_tag = hashlib.sha256(str(column).encode('utf-8')).hexdigest()[:12]
+    return f"{path}.{column_tag}{REFERENCE_SNAPSHOT_SUFFIX}"
+
+
+def _prune_lru_files(directory, max_bytes, suffix=''):
+    """
+    本地缓存目录按最近使用时间（修改时间，命中时刷新）淘汰文件，使 suffix 结尾的文件总大小不超过 max_bytes；
+    返回淘汰的文件数
+    """
+    if not os.path.isdir(directory):
+        return 0
+    files = []
+    for item in os.scandir(directory):
+        if item.is_file() and item.name.endswith(suffix) and not item.name.endswith('.tmp'):
+            stat = item.stat()
+            files.append((stat.st_mtime, stat.st_size, item.path))
+    total = sum(size for _, size, _ in files)
+    evicted = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
+
+
+@st.cache_resource(show_spinner=False)
+def _load_reference_set(path, column, signature):
+    """解析参考数据中的一列为 frozenset，同一进程内相同签名只解析一次"""
+    snapshot_path = _reference_snapshot_path(path, column)
+    # 快照签名包含列名和规整方式版本，文件、列或规整方式任一变化都会重新解析
+    snapshot_signature = (signature, column, REFERENCE_SNAPSHOT_VERSION)
+    values = _read_reference_snapshot(snapshot_path, snapshot_signature)
+    if values is not None:
+        return values
+    df = pd.read_excel(path, usecols=[column])
+    values = frozenset(df[column].dropna().astype(str).str.strip())
+    _write_reference_snapshot(snapshot_path, snapshot_signature, values)
+    return values
+
+
+def load_reference_set(relative_path, column):
+    """加载参考数据列：优先使用进程内缓存，其次使用 xlsx 旁的快照，最后才解析 xlsx"""
+    path = resource_path(relative_path)
+    return _load_reference_set(path, column, _reference_file_signature(path))
+
+
 # ======== 加载学校数据 =========
 try:
-    school_data_path = resource_path("school_data.xlsx")
-    school_df = pd.read_excel(school_data_path)
-    VALID_SCHOOL_NAMES = set(school_df['学校名称'].dropna().str.strip())
+    VALID_SCHOOL_NAMES = load_reference_set("school_data.xlsx", '学校名称')
     logging.info(f"成功加载 {len(VALID_SCHOOL_NAMES)} 个有效学校名称")
 except Exception as e:
     logging.error(f"读取 school_data.xlsx 出错：{e}")
-    VALID_SCHOOL_NAMES = set()
+    VALID_SCHOOL_NAMES = frozenset()
     st.warning("学校数据加载失败，学校名称检查功能将不可用")
 
 # ======== 加载招生专业数据 =========
 try:
-    major_data_path = resource_path("招生专业.xlsx")
-    major_df = pd.read_excel(major_data_path)
-    VALID_MAJOR_COMBOS = set(major_df['招生专业'].dropna().astype(str).str.strip())
+    VALID_MAJOR_COMBOS = load_reference_set("招生专业.xlsx", '招生专业')
     logging.info(f"成功加载 {len(VALID_MAJOR_COMBOS)} 个有效专业组合")
 except Exception as e:
     logging.error(f"读取 招生专业.xlsx 出错：{e}")
-    VALID_MAJOR_COMBOS = set()
+    VALID_MAJOR_COMBOS = frozenset()
     st.warning("专业数据加载失败，专业匹配功能将不可用")
 
-
-def check_school_name(name):
-    if pd.isna(name) or not str(name).strip():
-        return '学校名称为空'
-    return '匹配' if name.strip() in VALID_SCHOOL_NAMES else '不匹配'
-
-
-def check_major_combo(major, level):
-    if pd.isna(major) or pd.isna(level):
-        return "数据缺失"
-    combo = f"{str(major).strip()}{str(level).strip()}"
-    return "匹配" if combo in VALID_MAJOR_COMBOS else "不匹配"
-
-
-def convert_selection_requirement_from_requirement(req):
-    """
-    依据上传文件中的报考要求转换为选科要求说明与次选科目（与 docx 规范一致）。
-    1. 报考要求：不限 → 选科要求说明：不限科目专业组，次选科目：空白
-    2. 报考要求仅为单个字（如"化""政"）→ 选科要求说明：单科、多科均需选考，次选科目=报考要求
-    3. 报考要求中包含"且"（如"物且化"、"物且化且生"）→ 选科要求说明：单科、多科均需选考，次选科目为去掉"且"
-    4. 报考要求中包含"或"（如"物或化"、"物或化或生"）→ 选科要求说明：多门选考，次选科目为去掉"或"
-    """
-    if pd.isna(req) or not str(req).strip():
-        return "不限科目专业组", ""
-    s = str(req).strip()
-    if "不限" in s:
-        return "不限科目专业组", ""
-    if len(s) == 1:
-        return "单科、多科均需选考", s
-    if "且" in s:
-        return "单科、多科均需选考", s.replace("且", "")
-    if "或" in s:
-        return "多门选考", s.replace("或", "")
-    return "", ""
+xueyeqiao.set_reference_data(VALID_SCHOOL_NAMES, VALID_MAJOR_COMBOS)
 
 
 def _to_text(value):
@@ -253,237 +319,111 @@ def map_upload_row_to_export(row):
     return new_row
 
 
-CUSTOM_WHITELIST = {
-    "宏福校区", "沙河校区", "中外合作办学", "珠海校区", "江北校区", "津南校区", "开封校区",
-    "联合办学", "校企合作", "合作办学", "威海校区", "深圳校区", "苏州校区", "平果校区",
-    "江南校区", "合川校区", "长安校区", "崇安校区", "南校区", "东校区", "都市园艺", "甘肃兰州"
-}
-
-TYPO_DICT = {
-    "教助": "救助",
-    "指辉": "指挥",
-    "料学": "科学",
-    "话言": "语言",
-    "5十3": "5+3",
-    "5十3一体化": "5+3一体化",
-    "“5十3”一体化": "“5+3”一体化",
-    "5+31体化": "5+3一体化",
-    "5+3体化": "5+3一体化",
-    "色言": "色盲",
-    "NIT": "NIIT",
-    "色育": "色盲",
-    "人围": "入围",
-    "项月": "项目",
-    "币范类": "师范类",
-    "投课": "授课",
-    "就薄": "就读",
-    "电请": "申请",
-    "中国面": "中国画",
-    "火数民族": "少数民族",
-    "色自": "色盲",
-    "色盲色弱申报": "色盲色弱慎报",
-    "数学与应用数笑": "数学与应用数学",
-    "法学十": "法学+",
-    "浣海校区": "滨海校区",
-    "中溴": "中澳"
-}
-
-REGEX_PATTERNS = {
-    'excess_punct': re.compile(r'[，、。！？；,;.!? ]+'),
-    'outer_punct': re.compile(r'^[，、。！？；,;.!? ]+|[，、。！？；,;.!? ]+$'),
-    'consecutive_right': re.compile(r'）{2,}')
-}
-NESTED_PAREN_PATTERN = re.compile(r'（（(.*?)））')
-CONSECUTIVE_REPEAT_PATTERN = re.compile(r'（(.+?)）\s*（\1）')
-
-
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-
-def normalize_brackets(text):
-    """统一各种括号为中文括号并处理不完整括号"""
-    if pd.isna(text) or not str(text).strip():
-        return text
-    text = str(text).strip()
-
-    # 替换所有括号变体为中文括号
-    text = re.sub(r'[{\[【]', '（', text)  # 左括号
-    text = re.sub(r'[}\]】]', '）', text)  # 右括号
-    text = re.sub(r'[<《]', '（', text)  # 左书名号替换为左括号
-    text = re.sub(r'[>》]', '）', text)  # 右书名号替换为右括号
-
-    return text
-
-
-def clean_outer_punctuation(text):
-    """清理最外层括号外的标点符号"""
-    if pd.isna(text) or not str(text).strip():
-        return text
-    text = str(text).strip()
-    text = REGEX_PATTERNS['outer_punct'].sub('', text)
-    parts = re.split(r'(（.*?）)', text)
-    cleaned_parts = []
-    for part in parts:
-        if part.startswith('（') and part.endswith('）'):
-            cleaned_parts.append(part)
-        else:
-            cleaned_parts.append(REGEX_PATTERNS['outer_punct'].sub('', part))
-    return ''.join(cleaned_parts)
+# ============================
+# 模板导出（院校分/专业分等 Excel 模板的统一写出）
+# ============================
+# 院校分、专业分、学业桥检查结果等导出文件都是同一种模板结构：第1行为合并单元格的备注，
+# 第2行为招生年份行，第3行为标题行，第4行起为数据。模板规格（spec）为 dict：
+#   sheet_title        工作表名，默认 'Sheet'
+#   note               第1行备注文本
+#   note_range         备注合并区域，默认 'A1:U1'
+#   note_height        第1行行高，默认 220
+#   note_alignment     备注对齐方式，默认自动换行、顶端对齐
+#   header_rows        备注与标题行之间的表头行（每行为值列表），如 [['招生年份', 2024]]
+#   text_header_cells  表头中设为文本格式的单元格，如 ['B2']
+#   columns            标题行，同时也是数据列（按此顺序取 DataFrame 中的列，不存在的列整列为空）
+#   clean              单值清理函数；可为函数（作用于所有列）或 {列名: 函数}，按列去重后只对不同取值调用一次
+#   text_columns       设为文本格式的数据列（值为 None 的单元格不设置）
+#   text_skip_blank    为 True 时文本列中的空白值也不设置文本格式
+#   numeric_columns    转为浮点数写出的数据列（空值写为 0，无法转换的值按原值写出）
+#   column_widths      列宽，{列字母: 宽度}
+
+def _clean_export_value(value):
+    """导出前清理单个值：None、NaN 以及 'nan'、'none' 字符串写为空字符串"""
+    if value is None or pd.isna(value):
+        return ''
+    if isinstance(value, str) and value.lower() in ['nan', 'none']:
+        return ''
+    return value
 
 
-def check_score_consistency(row):
-    """检查分数一致性：最高分 >= 平均分 >= 最低分"""
-    issues = []
+def _numeric_export_value(value):
+    """数字列的单个值：空值写为 0，能转换为数字的写为浮点数，无法转换的保持原值"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 0.0
     try:
-        max_score = float(row['最高分']) if pd.notna(row['最高分']) else None
-        avg_score = float(row['平均分']) if pd.notna(row['平均分']) else None
-        min_score = float(row['最低分']) if pd.notna(row['最低分']) else None
-
-        if max_score is not None and avg_score is not None and max_score < avg_score:
-            issues.append(f"最高分({max_score}) < 平均分({avg_score})")
-
-        if max_score is not None and min_score is not None and max_score < min_score:
-            issues.append(f"最高分({max_score}) < 最低分({min_score})")
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return 0.0 if pd.isna(number) else number
 
-        if avg_score is not None and min_score is not None and avg_score < min_score:
-            issues.append(f"平均分({avg_score}) < 最低分({min_score})")
 
-    except (ValueError, TypeError) as e:
-        issues.append(f"分数格式错误: {str(e)}")
+def _template_column_values(data, column, clean):
+    """按列取出清理后的值列表；列不存在时整列为空字符串"""
+    if column not in data.columns:
+        return [''] * len(data)
+    func = clean.get(column) if isinstance(clean, dict) else clean
+    if func is None:
+        return data[column].tolist()
+    return map_field_values(data, column, func).tolist()
 
-    return '；'.join(issues) if issues else '无问题'
 
-
-def analyze_and_fix(text):
-    if pd.isna(text) or not str(text).strip():
-        return text, []
-
-    text = normalize_brackets(text)
-    text = clean_outer_punctuation(text)
-    issues = []
-
-    if text in CUSTOM_WHITELIST:
-        return text, []
-
-    # ========== 括号成对修正 ==========
-    text_list = list(text)
-    stack = []
-    unmatched_right = []
-
-    for i, char in enumerate(text_list):
-        if char == '（':
-            stack.append(i)
-        elif char == '）':
-            if stack:
-                stack.pop()
-            else:
-                unmatched_right.append(i)
-
-    for i in reversed(unmatched_right):
-        del text_list[i]
-        issues.append("删除多余右括号1个")
-
-    if stack:
-        text_list.extend(['）'] * len(stack))
-        issues.append(f"补充缺失右括号{len(stack)}个")
-
-    text = ''.join(text_list)
-
-    # 嵌套修正
-    text, nested_count = NESTED_PAREN_PATTERN.subn(r'（\1）', text)
-    if nested_count > 0:
-        issues.append(f"修复嵌套括号{nested_count}处")
-
-    # ========== 清理空括号或纯标点括号 ==========
-    def clean_empty_paren(m):
-        content = m.group(1).strip('，、,;；:：。！？.!? ')
-        if not content:
-            issues.append("删除空括号或仅含标点括号")
-            return ''
-        return f'（{content}）'
-
-    text = re.sub(r'（(.*?)）', clean_empty_paren, text)
-
-    # ========== 去重 ==========
-    seen = set()
-
-    def dedup(m):
-        c = m.group(1)
-        if c in seen:
-            issues.append(f"重复括号内容：'{c}'")
-            return ''
-        seen.add(c)
-        return f'（{c}）'
-
-    text = re.sub(r'（(.*?)）', dedup, text)
-
-    # ========== 多余标点简化 ==========
-    text = REGEX_PATTERNS['excess_punct'].sub(lambda m: m.group(0)[0], text)
-
-    # ========== 错别字修正 ==========
-    for typo, corr in TYPO_DICT.items():
-        if typo in text:
-            text = text.replace(typo, corr)
-            issues.append(f"错别字：'{typo}'→'{corr}'")
-
-    return text, issues
-
-
-def process_chunk(chunk):
+def write_template_workbook(output_path, data, spec):
     """
-    处理数据块。支持上传文件列名与导出列名并存：
-    学校名称/院校名称、招生专业/专业名称、招生科类/科类、选科要求/报考要求。
-    选科转换逻辑与 docx 一致：不限/单字/且/或 → 选科要求说明、次选。
+    按模板规格以只写模式一次写出 Excel：先写备注、表头行和标题行，再按列清理数据后逐行追加。
+    data 为 DataFrame 或记录列表。
     """
-    # 学校名称检查（支持 学校名称 或 院校名称）
-    school_col = '学校名称' if '学校名称' in chunk.columns else ('院校名称' if '院校名称' in chunk.columns else None)
-    if school_col:
-        chunk['学校匹配结果'] = chunk[school_col].apply(check_school_name)
-
-    # 专业匹配检查（支持 招生专业 或 专业名称，需有一级层次）
-    major_col = '招生专业' if '招生专业' in chunk.columns else ('专业名称' if '专业名称' in chunk.columns else None)
-    if major_col and '一级层次' in chunk.columns:
-        chunk['招生专业匹配结果'] = chunk.apply(
-            lambda r: check_major_combo(r[major_col], r['一级层次']), axis=1)
-
-    # 备注处理（支持 专业备注）
-    remark_col = None
-    for c in chunk.columns:
-        if '专业备注' in str(c):
-            remark_col = c
-            break
-    if remark_col is not None:
-        def process_remark(remark):
-            if pd.isna(remark) or not str(remark).strip():
-                return '无问题', ''
-            fixed_text, issues = analyze_and_fix(remark)
-            return '；'.join(issues) if issues else '无问题', fixed_text
-
-        chunk[['备注检查结果', '修改后备注']] = chunk[remark_col].apply(
-            lambda x: pd.Series(process_remark(x)))
-
-    # 分数检查
-    score_columns = ['最高分', '平均分', '最低分']
-    if all(col in chunk.columns for col in score_columns):
-        chunk['分数检查结果'] = chunk.apply(check_score_consistency, axis=1)
-
-    # 选科要求处理：依据 docx，支持 选科要求 或 报考要求，统一用 convert_selection_requirement_from_requirement
-    req_col = '选科要求' if '选科要求' in chunk.columns else ('报考要求' if '报考要求' in chunk.columns else None)
-    if req_col:
-        chunk[['选科要求说明', '次选']] = chunk[req_col].apply(
-            lambda x: pd.Series(convert_selection_requirement_from_requirement(x)))
-
-    # 招生科类处理（支持 招生科类 或 科类），统一为物理类/历史类并生成首选科目
-    cat_col = '招生科类' if '招生科类' in chunk.columns else ('科类' if '科类' in chunk.columns else None)
-    if cat_col:
-        chunk['招生科类'] = chunk[cat_col].replace({'物理': '物理类', '历史': '历史类'})
-        chunk['首选科目'] = chunk['招生科类'].apply(
-            lambda x: _get_first_subject(x) if pd.notna(x) and str(x).strip() else '')
-    elif '首选科目' not in chunk.columns and req_col:
-        chunk['首选科目'] = ''
-
-    return chunk
+    if not isinstance(data, pd.DataFrame):
+        data = pd.DataFrame(list(data))
+    columns = list(spec['columns'])
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(spec.get('sheet_title', 'Sheet'))
+
+    # 列宽、合并区域、行高需在写入第一行之前设置
+    for letter, width in (spec.get('column_widths') or {}).items():
+        ws.column_dimensions[letter].width = width
+    ws.merged_cells.add(spec.get('note_range', 'A1:U1'))
+    ws.row_dimensions[1].height = spec.get('note_height', 220)
+
+    # 第1行：备注
+    note_cell = WriteOnlyCell(ws, value=spec.get('note', ''))
+    note_cell.alignment = spec.get('note_alignment') or Alignment(wrap_text=True, vertical='top')
+    ws.append([note_cell])
+
+    # 第2行起：表头行（招生年份等），指定单元格为文本格式
+    text_header_cells = set(spec.get('text_header_cells', ()))
+    for row_idx, values in enumerate(spec.get('header_rows', ()), start=2):
+        row = list(values)
+        for col_idx, value in enumerate(values, start=1):
+            if f"{openpyxl.utils.get_column_letter(col_idx)}{row_idx}" in text_header_cells:
+                row[col_idx - 1] = WriteOnlyCell(ws, value=value)
+                row[col_idx - 1].number_format = numbers.FORMAT_TEXT
+        ws.append(row)
+
+    # 标题行
+    ws.append(columns)
+
+    # 数据行：逐列清理（去重后只处理不同取值），数字列转为浮点数，再按行组装写出
+    clean = spec.get('clean')
+    column_values = [_template_column_values(data, column, clean) for column in columns]
+    for column in spec.get('numeric_columns', ()):
+        pos = columns.index(column)
+        column_values[pos] = [_numeric_export_value(value) for value in column_values[pos]]
+    text_positions = [columns.index(column) for column in spec.get('text_columns', ()) if column in columns]
+    skip_blank = spec.get('text_skip_blank', False)
+    for values in zip(*column_values):
+        row = list(values)
+        for pos in text_positions:
+            value = row[pos]
+            if value is None or (skip_blank and str(value).strip() == ''):
+                continue
+            cell = WriteOnlyCell(ws, value=value)
+            cell.number_format = numbers.FORMAT_TEXT
+            row[pos] = cell
+        ws.append(row)
+
+    wb.save(output_path)
 
 
 # ============================
@@ -500,7 +440,7 @@ columns_to_convert = [
 ]
 
 
-def process_score_file(file_path):
+def process_score_file(file_path, output=None):
     # 首先读取年份（从B2单元格）
     try:
         wb = openpyxl.load_workbook(file_path, data_only=True)
@@ -561,36 +501,19 @@ def process_score_file(file_path):
         else:
             group_fields = ['学校名称', '省份', '一级层次', '招生科类', '招生批次', '招生类型（选填）']
 
-        # 每组最低分所在行
-        min_indices = df.groupby(group_fields)['最低分'].idxmin()
-
-        # 每组最高分
-        max_scores = df.groupby(group_fields)['最高分'].max()
-
-        # 取最低分行
-        result = df.loc[min_indices].copy()
-
-        # 补充最高分
-        def get_max_score(row):
-            key = tuple(row[col] for col in group_fields)
-            return max_scores.get(key, None)
-
-        result['最高分'] = result.apply(get_max_score, axis=1)
-
-        # 招生人数、录取人数按分组总和
-        enroll_groups = df.groupby(group_fields)['招生人数（选填）'].sum()
-        code_groups = df.groupby(group_fields)['录取人数（选填）'].sum()
-
-        def get_group_total(row, column_name):
-            key = tuple(row[col] for col in group_fields)
-            if column_name == '招生人数（选填）':
-                return enroll_groups.get(key, '')
-            elif column_name == '录取人数（选填）':
-                return code_groups.get(key, '')
-            return ''
+        # 一次分组同时得到：最低分所在行、最高分、招生人数总和、录取人数总和
+        group_stats = df.groupby(group_fields).agg(
+            min_index=('最低分', 'idxmin'),
+            max_score=('最高分', 'max'),
+            enroll_total=('招生人数（选填）', 'sum'),
+            admit_total=('录取人数（选填）', 'sum'),
+        )
 
-        result['招生人数（选填）'] = result.apply(lambda row: get_group_total(row, '招生人数（选填）'), axis=1)
-        result['录取人数（选填）'] = result.apply(lambda row: get_group_total(row, '录取人数（选填）'), axis=1)
+        # 取最低分行，分组统计结果与之一一对应，按位置直接回填
+        result = df.loc[group_stats['min_index']].copy()
+        result['最高分'] = group_stats['max_score'].to_numpy()
+        result['招生人数（选填）'] = group_stats['enroll_total'].to_numpy()
+        result['录取人数（选填）'] = group_stats['admit_total'].to_numpy()
 
     except Exception as e:
         raise Exception(f"分组字段错误：{e}")
@@ -654,7 +577,8 @@ def process_score_file(file_path):
     new_result['首选科目'] = get_col_values('首选科目')
     new_result['院校招生代码'] = get_col_values('招生代码')
 
-    output_path = file_path.replace('.xlsx', '_院校分.xlsx')
+    # output 为保存位置（路径或 BytesIO 等文件对象），默认保存在输入文件旁
+    output_path = output if output is not None else file_path.replace('.xlsx', '_院校分.xlsx')
 
     try:
         # 创建备注文本
@@ -672,80 +596,22 @@ def process_score_file(file_path):
 6.录取人数：仅能填写数字
 7.首选科目：新八省必填，只能填写（历史或物理）"""
 
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            # 先写入数据（不包含标题，从第4行开始）
-            new_result.to_excel(writer, index=False, header=False, startrow=3)
-            workbook = writer.book
-            worksheet = writer.sheets['Sheet1']
-
-            # 第一行：合并A1-U1并写入备注
-            worksheet.merge_cells('A1:U1')
-            worksheet['A1'] = remark_text
-            worksheet['A1'].alignment = Alignment(wrap_text=True, vertical='top')
-            # 设置第一行行高为215磅
-            worksheet.row_dimensions[1].height = 215
-
-            # 第二行：A2="招生年"，B2=年份，C2="1"，D2="模板类型（模板标识不要更改）"
-            worksheet['A2'] = '招生年'
-            # B2和C2设置为数字格式
-            try:
-                # 尝试将年份转换为数字
-                if year_value and str(year_value).strip():
-                    year_num = int(float(str(year_value).strip()))
-                    worksheet['B2'] = year_num
-                else:
-                    worksheet['B2'] = ''
-            except:
-                worksheet['B2'] = year_value
-            worksheet['C2'] = 1  # 直接设置为数字1
-            worksheet['D2'] = '模板类型（模板标识不要更改）'
-
-            # 第三行：标题行
-            headers = ['学校名称', '省份', '招生类别', '招生批次', '招生类型', '选测等级',
-                       '最高分', '最低分', '平均分', '最高位次', '最低位次', '平均位次',
-                       '录取人数', '招生人数', '数据来源', '省控线科类', '省控线批次', '省控线备注',
-                       '专业组代码', '首选科目', '院校招生代码']
-            for col_idx, header in enumerate(headers, start=1):
-                worksheet.cell(row=3, column=col_idx, value=header)
-
-            # 设置文本格式（从第4行开始，即数据行）
-            # 需要设置为文本格式的列（使用新列名，不包括招生人数和录取人数）
-            text_format_cols = ['专业组代码', '院校招生代码', '最高分', '最低分', '最低位次']
-            for col in text_format_cols:
-                if col in new_result.columns:
-                    col_idx = new_result.columns.get_loc(col) + 1
-                    for row in range(4, len(new_result) + 4):
-                        worksheet.cell(row=row, column=col_idx).number_format = numbers.FORMAT_TEXT
-
-            # 确保B2和C2单元格保持数字格式
-            if worksheet['B2'].value is not None and str(worksheet['B2'].value).strip():
-                try:
-                    worksheet['B2'].value = int(float(str(worksheet['B2'].value)))
-                except:
-                    pass
-            worksheet['C2'].value = 1
-
-            # 确保"录取人数"和"招生人数"列保持数字格式（从第4行开始）
-            if '录取人数' in new_result.columns:
-                col_idx = new_result.columns.get_loc('录取人数') + 1
-                for row in range(4, len(new_result) + 4):
-                    cell = worksheet.cell(row=row, column=col_idx)
-                    if cell.value is not None:
-                        try:
-                            cell.value = float(cell.value) if str(cell.value).strip() else 0
-                        except:
-                            pass
-
-            if '招生人数' in new_result.columns:
-                col_idx = new_result.columns.get_loc('招生人数') + 1
-                for row in range(4, len(new_result) + 4):
-                    cell = worksheet.cell(row=row, column=col_idx)
-                    if cell.value is not None:
-                        try:
-                            cell.value = float(cell.value) if str(cell.value).strip() else 0
-                        except:
-                            pass
-
+        # 第二行：A2="招生年"，B2=年份（数字格式），C2=1，D2="模板类型（模板标识不要更改）"
+        try:
+            year_cell = int(float(str(year_value).strip())) if year_value and str(year_value).strip() else ''
+        except:
+            year_cell = year_value
+
+        # 第一行备注合并A1-U1，行高215磅；代码、分数、位次列为文本格式，录取人数、招生人数保持数字格式
+        write_template_workbook(output_path, new_result, {
+            'sheet_title': 'Sheet1',
+            'note': remark_text,
+            'note_height': 215,
+            'header_rows': [['招生年', year_cell, 1, '模板类型（模板标识不要更改）']],
+            'columns': list(new_result.columns),
+            'text_columns': ['专业组代码', '院校招生代码', '最高分', '最低分', '最低位次'],
+            'numeric_columns': ['录取人数', '招生人数'],
+        })
         return output_path
     except Exception as e:
         raise Exception(f"文件保存失败：{e}")
@@ -850,24 +716,104 @@ def normalize_remark_type_mappings(mapping_df):
     return mappings
 
 
-def extract_recruitment_type(remark, mappings):
+def build_remark_type_matcher(mappings, exclusion_keywords=EXCLUSION_KEYWORDS):
+    """
+    将映射规则（已按优先级排序）和排除关键词编译为一个 Aho–Corasick 自动机，
+    扫描一遍备注即可得到优先级最高的招生类型以及是否包含排除关键词。
+    返回 (goto, fail, best, excluded, types)：
+    goto 为各状态的字符转移，fail 为失配跳转，best 为该状态（含后缀）命中的最靠前规则序号，
+    excluded 表示该状态（含后缀）是否命中排除关键词，types 为按规则序号排列的输出招生类型。
+    """
+    goto = [{}]
+    best = [None]
+    excluded = [False]
+
+    def insert(word):
+        state = 0
+        for ch in word:
+            if ch not in goto[state]:
+                goto[state][ch] = len(goto)
+                goto.append({})
+                best.append(None)
+                excluded.append(False)
+            state = goto[state][ch]
+        return state
+
+    types = []
+    for rank, item in enumerate(mappings):
+        types.append(item['输出招生类型'])
+        if not item['备注查找字段']:
+            continue
+        state = insert(item['备注查找字段'])
+        if best[state] is None:
+            best[state] = rank
+    for word in exclusion_keywords:
+        excluded[insert(word)] = True
+
+    # 按广度优先计算失配跳转，并把后缀状态的命中结果合并到当前状态
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0)
+            suffix = fail[nxt]
+            if best[suffix] is not None and (best[nxt] is None or best[suffix] < best[nxt]):
+                best[nxt] = best[suffix]
+            excluded[nxt] = excluded[nxt] or excluded[suffix]
+    return goto, fail, best, excluded, types
+
+
+def match_remark_type(matcher, remark):
+    """用 build_remark_type_matcher 的结果扫描备注，返回（招生类型, 需要核查）"""
     if pd.isna(remark) or not str(remark).strip():
-        return ''
-    remark_text = str(remark)
-    for item in mappings:
-        if item['备注查找字段'] and item['备注查找字段'] in remark_text:
-            return item['输出招生类型']
-    return ''
+        return '', '否'
+    goto, fail, best, excluded, types = matcher
+    state = 0
+    best_rank = None
+    has_exclusion = False
+    for ch in str(remark):
+        while state and ch not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(ch, 0)
+        if best[state] is not None and (best_rank is None or best[state] < best_rank):
+            best_rank = best[state]
+        has_exclusion = has_exclusion or excluded[state]
+    return (types[best_rank] if best_rank is not None else ''), ('是' if has_exclusion else '否')
+
+
+@lru_cache(maxsize=8)
+def _cached_remark_type_matcher(mapping_items):
+    mappings = [{'备注查找字段': key, '输出招生类型': output_type} for key, output_type in mapping_items]
+    return build_remark_type_matcher(mappings)
+
+
+def get_remark_type_matcher(mappings):
+    """按映射规则内容缓存编译好的自动机，相同规则只编译一次"""
+    return _cached_remark_type_matcher(tuple((item['备注查找字段'], item['输出招生类型']) for item in mappings))
+
+
+def extract_recruitment_type(remark, mappings):
+    return match_remark_type(get_remark_type_matcher(mappings), remark)[0]
 
 
 def remark_needs_review(remark):
-    if pd.isna(remark) or not str(remark).strip():
-        return '否'
-    remark_text = str(remark)
-    return '是' if any(word in remark_text for word in EXCLUSION_KEYWORDS) else '否'
+    return match_remark_type(get_remark_type_matcher([]), remark)[1]
 
 
-def process_remark_type_file(file_path, remark_col, mappings, progress_callback=None):
+def _text_cell(ws, value):
+    """只写模式下的单元格：非空值预先设为文本格式"""
+    cell = WriteOnlyCell(ws, value=value)
+    if value is not None and str(value).strip() != '':
+        cell.number_format = numbers.FORMAT_TEXT
+    return cell
+
+
+def process_remark_type_file(file_path, remark_col, mappings, progress_callback=None, output=None):
     try:
         df = pd.read_excel(file_path, header=0, keep_default_na=False)
     except Exception as e:
@@ -876,32 +822,24 @@ def process_remark_type_file(file_path, remark_col, mappings, progress_callback=
     if remark_col not in df.columns:
         raise Exception(f"备注字段 {remark_col} 不存在于文件中")
 
-    result_df = pd.DataFrame({
-        '备注': df[remark_col].apply(lambda x: '' if pd.isna(x) else str(x)),
-        '招生类型': df[remark_col].apply(lambda x: extract_recruitment_type(x, mappings)),
-        '需要核查': df[remark_col].apply(remark_needs_review)
-    })
-
-    output_path = os.path.splitext(file_path)[0] + '_备注提取结果.xlsx'
+    # output 为保存位置（路径或 BytesIO 等文件对象），默认保存在输入文件旁
+    output_path = output if output is not None else os.path.splitext(file_path)[0] + '_备注提取结果.xlsx'
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = 'Sheet1'
-
-        headers = ['备注', '招生类型', '需要核查']
-        for col_idx, header in enumerate(headers, start=1):
-            ws.cell(row=1, column=col_idx, value=header)
-
-        for row_idx, (_, row_data) in enumerate(result_df.iterrows(), start=2):
-            ws.cell(row=row_idx, column=1, value=row_data['备注'])
-            ws.cell(row=row_idx, column=2, value=row_data['招生类型'])
-            ws.cell(row=row_idx, column=3, value=row_data['需要核查'])
-
-        for col_idx in range(1, 4):
-            for row_idx in range(2, len(result_df) + 2):
-                cell = ws.cell(row=row_idx, column=col_idx)
-                if cell.value is not None and str(cell.value).strip() != '':
-                    cell.number_format = numbers.FORMAT_TEXT
+        # 只写模式：逐行计算并直接写出，不构建中间 DataFrame，也不需要再遍历一遍单元格设置格式
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        ws.append(['备注', '招生类型', '需要核查'])
+
+        matcher = get_remark_type_matcher(mappings)
+        row_cache = {}
+        for remark in df[remark_col]:
+            key = (type(remark), remark)
+            values = row_cache.get(key)
+            if values is None:
+                values = ('' if pd.isna(remark) else str(remark),) + match_remark_type(matcher, remark)
+                if not pd.isna(remark):
+                    row_cache[key] = values
+            ws.append([_text_cell(ws, value) for value in values])
 
         wb.save(output_path)
     except Exception as e:
@@ -916,8 +854,10 @@ def process_remark_type_file(file_path, remark_col, mappings, progress_callback=
 # 学业桥数据处理
 # ============================
 
-def process_remarks_file(file_path, progress_callback=None):
-    """学业桥数据处理：上传文件第1行为标题，校验指定列；校对学校/专业/备注后按新格式导出。"""
+def process_remarks_file(file_path, progress_callback=None, executor_mode=None, output=None):
+    """学业桥数据处理：上传文件第1行为标题，校验指定列；校对学校/专业/备注后按新格式导出。
+    executor_mode 可选 processes / threads / serial，默认使用 CHUNK_EXECUTOR_MODE。
+    output 为保存位置（路径或 BytesIO 等文件对象），默认保存在输入文件旁。"""
     try:
         # 上传文件从第一行（标题行）开始读取
         df = pd.read_excel(file_path, header=0, dtype={
@@ -935,20 +875,7 @@ def process_remarks_file(file_path, progress_callback=None):
         if col in df.columns:
             df[col] = df[col].astype(str)
     # 专业备注列已在上传列中，无需再查找或重命名
-    chunks = []
-    for i in range(0, len(df), 1000):
-        chunks.append(df.iloc[i:i + 1000].copy())
-    results = {}
-    total_chunks = len(chunks)
-    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
-        future_to_index = {executor.submit(process_chunk, chunk): idx for idx, chunk in enumerate(chunks)}
-        for count, future in enumerate(as_completed(future_to_index)):
-            idx = future_to_index[future]
-            results[idx] = future.result()
-            if progress_callback:
-                progress_callback(count + 1, total_chunks)
-    ordered_results = [results[i] for i in sorted(results.keys())]
-    final_result = pd.concat(ordered_results)
+    final_result = run_chunks(df, mode=executor_mode, progress_callback=progress_callback)
     # 从上传数据取招生年份（年份列第一个非空值）
     year_value = ''
     if '年份' in final_result.columns:
@@ -972,39 +899,21 @@ def process_remarks_file(file_path, progress_callback=None):
     for col in ['最高分', '最低分', '平均分']:
         if col in export_df.columns:
             export_df[col] = export_df[col].apply(_format_score)
-    output_path = file_path.replace('.xlsx', '_检查结果.xlsx')
+    output_path = output if output is not None else file_path.replace('.xlsx', '_检查结果.xlsx')
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = 'Sheet1'
-        # 第1行：A1-U1 合并，行高 220 磅，备注内容
-        ws.merge_cells('A1:U1')
-        ws['A1'] = XUEYEQIAO_EXPORT_NOTE
-        ws['A1'].alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-        ws.row_dimensions[1].height = 220
-        # 第2行：A2=招生年份，B2=年份
-        ws['A2'] = '招生年份'
-        ws['B2'] = year_value
-        # 第3行：标题行
-        for col_idx, col_name in enumerate(XUEYEQIAO_EXPORT_HEADERS, start=1):
-            ws.cell(row=3, column=col_idx, value=col_name)
-        # 第4行起：数据
-        for row_idx, (_, row_data) in enumerate(export_df.iterrows(), start=4):
-            for col_idx, col_name in enumerate(XUEYEQIAO_EXPORT_HEADERS, start=1):
-                val = row_data.get(col_name)
-                if pd.isna(val):
-                    val = ''
-                ws.cell(row=row_idx, column=col_idx, value=val)
-        # 专业组代码、专业代码、招生代码等列为文本格式
-        text_cols = ['专业组代码', '专业代码', '招生代码', '最低分位次（选填）', '招生人数（选填）', '最低分数区间低', '最低分数区间高', '最低分数区间位次低', '最低分数区间位次高', '录取人数（选填）']
-        for col_name in text_cols:
-            if col_name in XUEYEQIAO_EXPORT_HEADERS:
-                col_idx = XUEYEQIAO_EXPORT_HEADERS.index(col_name) + 1
-                for r in range(4, len(export_df) + 4):
-                    cell = ws.cell(row=r, column=col_idx)
-                    if cell.value is not None and str(cell.value).strip() != '':
-                        cell.number_format = numbers.FORMAT_TEXT
-        wb.save(output_path)
+        # 第1行：A1-U1 合并，行高 220 磅，备注内容；第2行：A2=招生年份，B2=年份
+        # 专业组代码、专业代码、招生代码等列的非空值为文本格式
+        write_template_workbook(output_path, export_df, {
+            'sheet_title': 'Sheet1',
+            'note': XUEYEQIAO_EXPORT_NOTE,
+            'note_alignment': Alignment(wrap_text=True, vertical='top', horizontal='left'),
+            'header_rows': [['招生年份', year_value]],
+            'columns': XUEYEQIAO_EXPORT_HEADERS,
+            'clean': lambda val: '' if pd.isna(val) else val,
+            'text_columns': ['专业组代码', '专业代码', '招生代码', '最低分位次（选填）', '招生人数（选填）', '最低分数区间低',
+                             '最低分数区间高', '最低分数区间位次低', '最低分数区间位次高', '录取人数（选填）'],
+            'text_skip_blank': True,
+        })
     except Exception as e:
         raise Exception(f"保存文件错误：{e}")
     return output_path
@@ -1035,7 +944,7 @@ columns_to_convert_new = [
 ]
 
 
-def process_new_template_file(file_path):
+def process_new_template_file(file_path, output=None):
     # 首先读取原始文件的B2单元格内容
     try:
         wb_original = openpyxl.load_workbook(file_path, data_only=True)
@@ -1128,58 +1037,28 @@ def process_new_template_file(file_path):
     else:
         new_result['是否校考'] = '否'
 
-    # 输出文件路径
-    output_path = file_path.replace('.xlsx', '_院校分.xlsx')
+    # 输出位置（路径或 BytesIO 等文件对象），默认保存在输入文件旁
+    output_path = output if output is not None else file_path.replace('.xlsx', '_院校分.xlsx')
 
     try:
-        # 创建新的工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = 'Sheet1'
-
-        # 第一行：A1-K1合并单元格，行高90磅
-        ws.merge_cells('A1:K1')
-        cell_a1 = ws['A1']
-        cell_a1.value = '备注：请删除示例后再填写；\n1.省份：必须填写各省份简称，例如：北京、内蒙古，不能带有市、省、自治区、空格、特殊字符等\n2.最低分位次：仅能填写数字\n3.录取人数：仅能填写数字\n4.是否校考：有效值【是，否】，不填写或不在有效值中默认\'否\''
-        cell_a1.alignment = Alignment(wrap_text=True, vertical='top', horizontal='left')
-        ws.row_dimensions[1].height = 90
-
-        # 第二行：A2="招生年"，B2=原始文件B2的内容
-        ws['A2'] = '招生年'
-        ws['B2'] = b2_value
-
-        # 第三行：标题行
-        for col_idx, col_name in enumerate(new_columns, start=1):
-            ws.cell(row=3, column=col_idx, value=col_name)
-
-        # 第四行开始：数据行
-        for row_idx, (_, row_data) in enumerate(new_result.iterrows(), start=4):
-            ws.cell(row=row_idx, column=1, value=row_data['学校名称'] if pd.notna(row_data['学校名称']) else None)
-            ws.cell(row=row_idx, column=2, value=row_data['省份'] if pd.notna(row_data['省份']) else None)
-            ws.cell(row=row_idx, column=3, value=row_data['招生类别'] if pd.notna(row_data['招生类别']) else None)
-            ws.cell(row=row_idx, column=4, value=row_data['招生批次'] if pd.notna(row_data['招生批次']) else None)
-            ws.cell(row=row_idx, column=5, value=row_data['专业类别'] if pd.notna(row_data['专业类别']) else None)
-            ws.cell(row=row_idx, column=6, value=row_data['投档分'] if pd.notna(row_data['投档分']) else None)
-            ws.cell(row=row_idx, column=7, value=row_data['位次'] if pd.notna(row_data['位次']) else None)
-            ws.cell(row=row_idx, column=8, value=row_data['招生代码'] if pd.notna(row_data['招生代码']) else None)
-            ws.cell(row=row_idx, column=9, value=row_data['专业组'] if pd.notna(row_data['专业组']) else None)
-            ws.cell(row=row_idx, column=10, value=row_data['备注'] if pd.notna(row_data['备注']) else None)
-            ws.cell(row=row_idx, column=11, value=row_data['是否校考'] if pd.notna(row_data['是否校考']) else '否')
-
-        # 设置文本格式（从第4行开始，即数据行）
-        # 需要设置为文本格式的列
-        text_format_cols = ['招生代码', '专业组', '位次']
-        for col_name in text_format_cols:
-            col_idx = new_columns.index(col_name) + 1
-            for row in range(4, len(new_result) + 4):
-                cell = ws.cell(row=row, column=col_idx)
-                if cell.value is not None:
-                    # 将值转换为字符串，然后设置为文本格式
-                    cell.value = str(cell.value)
-                    cell.number_format = numbers.FORMAT_TEXT
-
-        # 保存文件
-        wb.save(output_path)
+        # 空值不写入；是否校考为空时默认'否'；招生代码、专业组、位次转换为字符串并设置为文本格式
+        clean = {col_name: (lambda value: value if pd.notna(value) else None) for col_name in new_columns}
+        clean['是否校考'] = lambda value: value if pd.notna(value) else '否'
+        for col_name in ['招生代码', '专业组', '位次']:
+            clean[col_name] = lambda value: str(value) if pd.notna(value) else None
+
+        # 第一行：A1-K1合并单元格，行高90磅；第二行：A2="招生年"，B2=原始文件B2的内容
+        write_template_workbook(output_path, new_result, {
+            'sheet_title': 'Sheet1',
+            'note': '备注：请删除示例后再填写；\n1.省份：必须填写各省份简称，例如：北京、内蒙古，不能带有市、省、自治区、空格、特殊字符等\n2.最低分位次：仅能填写数字\n3.录取人数：仅能填写数字\n4.是否校考：有效值【是，否】，不填写或不在有效值中默认\'否\'',
+            'note_range': 'A1:K1',
+            'note_height': 90,
+            'note_alignment': Alignment(wrap_text=True, vertical='top', horizontal='left'),
+            'header_rows': [['招生年', b2_value]],
+            'columns': new_columns,
+            'clean': clean,
+            'text_columns': ['招生代码', '专业组', '位次'],
+        })
         return output_path
     except Exception as e:
         raise Exception(f"文件保存失败：{e}")
@@ -1189,8 +1068,9 @@ def process_new_template_file(file_path):
 # 一分一段数据处理
 # ============================
 
-def process_segmentation_file(file_path):
-    output_path = os.path.splitext(file_path)[0] + "_校验结果.xlsx"
+def process_segmentation_file(file_path, output=None):
+    # output 为保存位置（路径或 BytesIO 等文件对象），默认保存在输入文件旁
+    output_path = output if output is not None else os.path.splitext(file_path)[0] + "_校验结果.xlsx"
     wb = openpyxl.load_workbook(file_path)
     ws = wb.active
 
@@ -1213,14 +1093,34 @@ def process_segmentation_file(file_path):
 
     yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
 
+    # 第8行起的 A(分数)、B(人数)、C(累计人数)、E、F 列一次性读入列表，
+    # 补断点、自动补人数和校验都在列表上完成，最后整体写回，避免逐行 insert_rows 导致的平方级耗时
+    first_row = 8
+    # 没有数据行时只写入表头和年份校验，不在空白的第8行写校验结果
+    if ws.max_row < first_row:
+        wb.save(output_path)
+        return output_path
+    rows = [
+        {'src': src_row, 'A': a, 'B': b, 'C': c, 'E': e, 'F': f, 'inserted': False, 'changed': set()}
+        for src_row, (a, b, c, _, e, f) in enumerate(
+            ws.iter_rows(min_row=first_row, max_row=ws.max_row, max_col=6, values_only=True), start=first_row)
+    ]
+
+    def set_value(record, col, value):
+        record[col] = value
+        record['changed'].add(col)
+
+    def gap_record(score, num, total):
+        return {'src': None, 'A': score, 'B': num, 'C': total, 'E': '补断点', 'F': '补断点',
+                'inserted': True, 'changed': {'A', 'B', 'C', 'E', 'F'}}
+
     # ---------- 第8行特殊处理 ----------
-    row = 8
-    curr_score = ws[f"A{row}"].value
-    curr_num = ws[f"B{row}"].value
-    curr_total = ws[f"C{row}"].value
+    first = rows[0]
+    curr_num = first['B']
+    curr_total = first['C']
 
     try:
-        score_int = int(float(str(curr_score).split('-')[0]))
+        score_int = int(float(str(first['A']).split('-')[0]))
     except:
         score_int = None
 
@@ -1228,95 +1128,76 @@ def process_segmentation_file(file_path):
     if curr_total is not None:
         if curr_num is None or curr_num == "":
             # 没有人数 → 自动计算
-            if row == 8:
-                ws[f"B{row}"] = curr_total
-            else:
-                prev_total = ws[f"C{row - 1}"].value
-                if prev_total is not None:
-                    ws[f"B{row}"] = curr_total - prev_total
+            set_value(first, 'B', curr_total)
         else:
-            # 有人数和累计人数不一致时插入补断点行
+            # 有人数和累计人数不一致时在第8行之前插入补断点行
             if curr_num != curr_total:
                 try:
                     insert_score = score_int + 1
                     insert_num = curr_total - curr_num
-                    ws.insert_rows(row)
-                    ws[f"A{row}"] = f"{insert_score}{suffix}"  # ✅ 仅加后缀在新增行
-                    ws[f"B{row}"] = insert_num
-                    ws[f"C{row}"] = insert_num
-                    for col in ['A', 'B', 'C', 'E', 'F']:
-                        ws[f"{col}{row}"].fill = yellow_fill
-                    ws[f"E{row}"] = "补断点"
-                    ws[f"F{row}"] = "补断点"
+                    rows.insert(0, gap_record(f"{insert_score}{suffix}", insert_num, insert_num))  # ✅ 仅加后缀在新增行
                     inserted = True
                 except:
                     pass
 
     # 仅当没有插入行时，第8行加后缀
     if not inserted and score_int is not None:
-        ws[f"A{row}"] = f"{score_int}{suffix}"
+        set_value(first, 'A', f"{score_int}{suffix}")
 
     # ---------- 补断点逻辑 ----------
-    while row < ws.max_row:
-        curr = ws[f"A{row}"].value
-        next = ws[f"A{row + 1}"].value
+    # 相邻两行分数相差大于1时，依次补上缺失的每个分数（人数为0，累计人数沿用上一行）
+    filled_rows = [rows[0]]
+    for next_record in rows[1:]:
+        curr_record = filled_rows[-1]
         try:
-            curr_score_int = int(str(curr).split('-')[0])
-            next_score_int = int(str(next).split('-')[0])
+            curr_score_int = int(str(curr_record['A']).split('-')[0])
+            next_score_int = int(str(next_record['A']).split('-')[0])
         except:
-            row += 1
-            continue
-
-        if curr_score_int - next_score_int > 1:
-            missing_score = curr_score_int - 1
-            ws.insert_rows(row + 1)
-            ws[f"A{row + 1}"] = missing_score
-            ws[f"B{row + 1}"] = 0
-            ws[f"C{row + 1}"] = ws[f"C{row}"].value
-            for col in ['A', 'B', 'C', 'E', 'F']:
-                ws[f"{col}{row + 1}"].fill = yellow_fill
-            ws[f"E{row + 1}"] = "补断点"
-            ws[f"F{row + 1}"] = "补断点"
-        else:
-            row += 1
+            curr_score_int = next_score_int = None
+        if curr_score_int is not None:
+            for missing_score in range(curr_score_int - 1, next_score_int, -1):
+                filled_rows.append(gap_record(missing_score, 0, curr_record['C']))
+        filled_rows.append(next_record)
+    rows = filled_rows
 
     # ---------- 校验与自动补人数 ----------
-    for row in range(8, ws.max_row + 1):
-        curr_score = ws[f"A{row}"].value
-        curr_num = ws[f"B{row}"].value
-        curr_total = ws[f"C{row}"].value
-        prev_total = ws[f"C{row - 1}"].value if row > 8 else None
-        prev_score = ws[f"A{row - 1}"].value if row > 8 else None
+    correct_total = None
+    for i, record in enumerate(rows):
+        curr_score = record['A']
+        curr_num = record['B']
+        curr_total = record['C']
+        prev_total = rows[i - 1]['C'] if i > 0 else None
+        prev_score = rows[i - 1]['A'] if i > 0 else None
 
         # 自动补人数
         if (curr_num is None or curr_num == "") and curr_total is not None:
-            if row == 8:
-                ws[f"B{row}"] = curr_total
+            if i == 0:
+                set_value(record, 'B', curr_total)
                 curr_num = curr_total
             elif prev_total is not None:
                 try:
                     calc = curr_total - prev_total
-                    ws[f"B{row}"] = calc
+                    set_value(record, 'B', calc)
                     curr_num = calc
                 except:
                     pass
 
         # 校验累计人数
-        if row == 8:
+        if i == 0:
             # 第8行直接标记正确（假设第8行累计人数正确）
-            if ws[f"E{row}"].value != "补断点":
-                ws[f"E{row}"] = "√"
+            if record['E'] != "补断点":
+                set_value(record, 'E', "√")
             correct_total = curr_total
         else:
             if curr_num is not None and curr_total is not None and correct_total is not None:
                 expected_total = correct_total + curr_num
                 if expected_total == curr_total:
-                    if ws[f"E{row}"].value != "补断点":
-                        ws[f"E{row}"] = "√"
+                    if record['E'] != "补断点":
+                        set_value(record, 'E', "√")
                     correct_total = curr_total  # 本行累计正确，用它更新基准
                 else:
-                    if ws[f"E{row}"].value != "补断点":
-                        ws[f"E{row}"] = f"× 应为{expected_total}"
+                    if record['E'] != "补断点":
+                        set_value(record, 'E', f"× 应为{expected_total}")
                     correct_total = expected_total
 
         # 校验分数差
@@ -1329,14 +1210,37 @@ def process_segmentation_file(file_path):
         if curr_score_num is not None and prev_score_num is not None:
             diff = prev_score_num - curr_score_num
             if diff == 1:
-                if ws[f"F{row}"].value != "补断点":
-                    ws[f"F{row}"] = "√"
+                if record['F'] != "补断点":
+                    set_value(record, 'F', "√")
             else:
-                if ws[f"F{row}"].value != "补断点":
-                    ws[f"F{row}"] = f"× 差值{diff}"
+                if record['F'] != "补断点":
+                    set_value(record, 'F', f"× 差值{diff}")
         else:
-            if ws[f"F{row}"].value != "补断点":
-                ws[f"F{row}"] = "× 分数非数字，无法校验"
+            if record['F'] != "补断点":
+                set_value(record, 'F', "× 分数非数字，无法校验")
+
+    # ---------- 写回工作表 ----------
+    # 原有行整体下移到新位置：按偏移量相同的连续行分块，自下而上移动，每块只调用一次 move_range
+    last_col = openpyxl.utils.get_column_letter(max(ws.max_column, 6))
+    offsets = [(record['src'], new_row - record['src'])
+               for new_row, record in enumerate(rows, start=first_row) if record['src'] is not None]
+    blocks = []
+    for src_row, offset in offsets:
+        if blocks and blocks[-1][2] == offset:
+            blocks[-1][1] = src_row
+        else:
+            blocks.append([src_row, src_row, offset])
+    for block_start, block_end, offset in reversed(blocks):
+        if offset:
+            ws.move_range(f"A{block_start}:{last_col}{block_end}", rows=offset)
+
+    for new_row, record in enumerate(rows, start=first_row):
+        for col in ('A', 'B', 'C', 'E', 'F'):
+            if col in record['changed']:
+                ws[f"{col}{new_row}"] = record[col]
+        if record['inserted']:
+            for col in ('A', 'B', 'C', 'E', 'F'):
+                ws[f"{col}{new_row}"].fill = yellow_fill
 
     wb.save(output_path)
     return output_path
@@ -1369,23 +1273,6 @@ def export_match_result_to_excel(export_df, headers, year_value, output_path):
 12.新八省首选科目必须选择（物理或历史）
 13.分数区间仅限北京"""
 
-    # 创建工作簿
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # 第一行：合并A1-U1并写入备注
-    ws.merge_cells('A1:U1')
-    ws['A1'] = remark_text
-    ws['A1'].alignment = Alignment(wrap_text=True, vertical='top')
-    # 设置第一行行高为220磅
-    ws.row_dimensions[1].height = 220
-
-    # 第二行：A2="招生年份"，B2=年份值
-    ws['A2'] = '招生年份'
-    ws['B2'] = year_value if year_value else ''
-    # B2设置为文本格式
-    ws['B2'].number_format = numbers.FORMAT_TEXT
-
     # 处理标题行：如果headers为空或None，使用export_df的列名
     if not headers or len(headers) == 0:
         headers = list(export_df.columns)
@@ -1405,28 +1292,16 @@ def export_match_result_to_excel(export_df, headers, year_value, output_path):
         if col not in final_headers:
             final_headers.append(col)
 
-    # 第三行：标题行（使用处理后的标题）
-    for col_idx, header in enumerate(final_headers, start=1):
-        ws.cell(row=3, column=col_idx, value=header if header else '')
-
-    # 数据行（从第4行开始）
-    for row_idx, (_, row_data) in enumerate(export_df.iterrows(), start=4):
-        for col_idx, header in enumerate(final_headers, start=1):
-            if header in export_df.columns:
-                value = row_data[header]
-                # 处理空值
-                if value is None or pd.isna(value):
-                    value = ''
-                elif isinstance(value, str) and value.lower() in ['nan', 'none']:
-                    value = ''
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                # 设置代码列为文本格式
-                if header in ['专业组代码', '专业代码', '招生代码']:
-                    cell.number_format = numbers.FORMAT_TEXT
-            else:
-                ws.cell(row=row_idx, column=col_idx, value='')
-
-    wb.save(output_path)
+    # 第一行：合并A1-U1写入备注，行高220磅；第二行：A2="招生年份"，B2=年份值（文本格式）
+    # 数据行清理空值（None、NaN、'nan'、'none' 写为空），标题不在 export_df 中的列整列为空，代码列为文本格式
+    write_template_workbook(output_path, export_df, {
+        'note': remark_text,
+        'header_rows': [['招生年份', year_value if year_value else '']],
+        'text_header_cells': ['B2'],
+        'columns': final_headers,
+        'clean': _clean_export_value,
+        'text_columns': [header for header in ['专业组代码', '专业代码', '招生代码'] if header in export_df.columns],
+    })
 
 
 # ============================
@@ -1450,155 +1325,413 @@ rename_mapping_B = {
 }
 
 
+# 候选记录中展示的字段：展示名 -> B表（重命名后）的列名
+MANUAL_FILL_CANDIDATE_FIELDS = {
+    "专业组代码": "专业组代码",
+    "学校名称": "学校名称",
+    "省份": "省份",
+    "招生专业": "招生专业",
+    "一级层次": "一级层次",
+    "招生科类": "招生科类",
+    "招生批次": "招生批次",
+    "招生类型（选填）": "招生类型（选填）",
+    "备注（招生计划）": "专业备注（选填）",  # B表重命名后的备注字段
+}
+
+# 需要手动补充的记录中保留的A表字段
+MANUAL_FILL_ROW_FIELDS = [
+    "学校名称", "省份", "招生专业", "一级层次", "招生科类", "招生批次", "招生类型（选填）", "专业备注（选填）"
+]
+
+
+def build_match_keys(df, key_fields):
+    """按列拼接组合键：各字段空值视为空字符串、去除首尾空白后以 | 连接"""
+    parts = [df[field].fillna("").astype(str).str.strip() for field in key_fields]
+    keys = parts[0]
+    for part in parts[1:]:
+        keys = keys + "|" + part
+    return keys
+
+
 def process_data(dfA, dfB):
     dfB.rename(columns=rename_mapping_B, inplace=True)
 
     # 构建组合键（不含备注和招生类型）：学校-省份-层次-科类-批次-专业
     key_fields = [f for f in tableA_fields if f not in ["专业备注（选填）", "招生类型（选填）"]]
-    dfA["组合键"] = dfA[key_fields].fillna("").astype(str).apply(
-        lambda x: "|".join([str(i).strip() for i in x]), axis=1)
-    dfB["组合键"] = dfB[key_fields].fillna("").astype(str).apply(
-        lambda x: "|".join([str(i).strip() for i in x]), axis=1)
+    dfA["组合键"] = build_match_keys(dfA, key_fields)
+    dfB["组合键"] = build_match_keys(dfB, key_fields)
 
-    # 检查A表和B表中组合键的重复性
-    # 统计A表中每个组合键出现的次数
+    # 检查A表和B表中组合键的重复性：统计每个组合键在两表中出现的次数
     a_key_counts = dfA["组合键"].value_counts()
-    # 统计B表中每个组合键出现的次数
     b_key_counts = dfB["组合键"].value_counts()
+    a_counts = dfA["组合键"].map(a_key_counts).to_numpy()
+    b_counts = dfA["组合键"].map(b_key_counts).fillna(0).to_numpy()
+
+    # A表和B表中都没有重复、且B表中只有唯一候选记录时，直接取该记录的专业组代码
+    unique_match = (a_counts == 1) & (b_counts == 1)
+    b_unique = dfB.loc[(dfB["组合键"].map(b_key_counts) == 1).to_numpy()]
+    code_by_key = pd.Series(b_unique["专业组代码"].to_numpy(dtype=object), index=b_unique["组合键"].to_numpy())
+    codes = np.full(len(dfA), "", dtype=object)
+    codes[unique_match] = code_by_key.reindex(dfA["组合键"].to_numpy()[unique_match]).to_numpy()
+    dfA["专业组代码"] = pd.Series(codes, index=dfA.index).infer_objects()
+
+    # 只要专业组代码没匹配到的，都需要手动选择：
+    # 未直接匹配的行以B表中该组合键的全部记录为候选；直接匹配但代码为空的行没有候选记录
+    code_missing = np.fromiter((not code or code == "" for code in codes), dtype=bool, count=len(codes))
+    manual_positions = np.flatnonzero(code_missing)
+    if len(manual_positions) == 0:
+        return dfA, []
+
+    manual_rows = dfA.iloc[manual_positions]
+    candidate_keys = set(manual_rows["组合键"].to_numpy()[~unique_match[manual_positions]])
+
+    # 只为需要手动补充的组合键生成候选记录
+    candidates = dfB.loc[dfB["组合键"].isin(candidate_keys).to_numpy()]
+    candidate_columns = [c for c in MANUAL_FILL_CANDIDATE_FIELDS.values() if c in candidates.columns]
+    candidates_by_key = {}
+    for key, record in zip(candidates["组合键"].to_numpy(), candidates[candidate_columns].to_dict("records")):
+        candidates_by_key.setdefault(key, []).append({
+            name: record.get(column, "") for name, column in MANUAL_FILL_CANDIDATE_FIELDS.items()
+        })
 
-    # 找出A表中有重复的组合键（出现次数>1）
-    a_duplicate_keys = set(a_key_counts[a_key_counts > 1].index)
-    # 找出B表中有重复的组合键（出现次数>1）
-    b_duplicate_keys = set(b_key_counts[b_key_counts > 1].index)
+    # 存储需要手动补充的记录信息（包含完整的候选记录信息）
+    row_columns = [c for c in MANUAL_FILL_ROW_FIELDS if c in manual_rows.columns]
+    manual_fill_records = []
+    for idx, key, matched, row in zip(manual_rows.index, manual_rows["组合键"].to_numpy(),
+                                      unique_match[manual_positions],
+                                      manual_rows[row_columns].to_dict("records")):
+        record = {"索引": idx}
+        record.update({field: row.get(field, "") for field in MANUAL_FILL_ROW_FIELDS})
+        # 完整的候选记录列表（可能为空）；每行使用独立的列表，便于后续单独修改
+        record["候选记录"] = [] if matched else [dict(c) for c in candidates_by_key.get(key, [])]
+        manual_fill_records.append(record)
 
-    # 构建B表字典：组合键 → 记录列表
-    b_dict = dfB.groupby("组合键").apply(lambda x: x.to_dict("records")).to_dict()
+    return dfA, manual_fill_records
 
-    # 存储需要手动补充的记录信息
-    manual_fill_records = []
 
-    def get_code(row):
-        key = row["组合键"]
-        candidates = b_dict.get(key, [])
+def build_manual_fill_store(manual_fill_records):
+    """
+    将需要手动补充的记录整理为按索引查找的结构，页面筛选和翻页时不再扫描整个列表：
+    records：索引 -> 记录（按原顺序）；order：全部记录的索引列表；
+    by_province：省份 -> 该省份记录的索引列表；provinces：可筛选的省份（排序后，不含空值）
+    """
+    records = {}
+    by_province = {}
+    for record in manual_fill_records:
+        idx = record["索引"]
+        records[idx] = record
+        province = record.get("省份", "")
+        if pd.isna(province):
+            province = ""
+        by_province.setdefault(province, []).append(idx)
+    return {
+        'records': records,
+        'order': list(records),
+        'by_province': by_province,
+        'provinces': sorted(p for p in by_province if p),
+    }
 
-        # 检查该组合键在A表或B表中是否有重复
-        has_duplicate_in_a = key in a_duplicate_keys
-        has_duplicate_in_b = key in b_duplicate_keys
 
-        # 如果A表或B表中任何一个有重复，需要手动补充
-        if has_duplicate_in_a or has_duplicate_in_b:
-            # 返回完整的候选记录列表（包含所有字段信息）
-            return None, candidates if candidates else []
+def apply_manual_codes(result_df, selections):
+    """
+    将手动选择的专业组代码（索引 -> 代码）一次性写入匹配结果的专业组代码列，直接修改 result_df；
+    空值和"请选择"不写入，返回写入的记录数
+    """
+    codes = {
+        idx: str(code).strip() for idx, code in selections.items()
+        if code and code != "请选择" and str(code).strip()
+    }
+    if not codes:
+        return 0
+    column = result_df["专业组代码"]
+    if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+        # 数值列先转为 object，避免写入文本代码时类型不兼容
+        result_df["专业组代码"] = column.astype(object)
+    result_df.loc[list(codes), "专业组代码"] = list(codes.values())
+    return len(codes)
 
-        # A表和B表中都没有重复，且B表中只有唯一候选记录，可以直接匹配
-        if len(candidates) == 1:
-            return candidates[0]["专业组代码"], None
 
-        # 其他情况（无候选记录或多个候选记录）都需要手动补充
-        # 返回None和候选记录列表（可能为空）
-        return None, candidates if candidates else []
+# ========== 就业质量报告图片提取 ==========
 
-    # 应用匹配逻辑
-    results = dfA.apply(get_code, axis=1)
-    dfA["专业组代码"] = results.apply(lambda x: x[0] if x[0] is not None else "")
-    
-    # 收集需要手动补充的记录（包含完整的候选记录信息）
-    # 只要专业组代码没匹配到的，都需要手动选择
-    for idx, row in dfA.iterrows():
-        result = results.iloc[idx]
-        matched_code = result[0]  # 匹配到的专业组代码
-        candidates = result[1] if result[1] is not None else []
-        
-        # 如果专业组代码为空（没有匹配到），需要手动补充
-        if not matched_code or matched_code == "":
-            # 提取候选记录的详细信息
-            candidate_records = []
-            for candidate in candidates:
-                candidate_records.append({
-                    "专业组代码": candidate.get("专业组代码", ""),
-                    "学校名称": candidate.get("学校名称", ""),
-                    "省份": candidate.get("省份", ""),
-                    "招生专业": candidate.get("招生专业", ""),
-                    "一级层次": candidate.get("一级层次", ""),
-                    "招生科类": candidate.get("招生科类", ""),
-                    "招生批次": candidate.get("招生批次", ""),
-                    "招生类型（选填）": candidate.get("招生类型（选填）", ""),
-                    "备注（招生计划）": candidate.get("专业备注（选填）", ""),  # B表重命名后的备注字段
-                })
-            
-            manual_fill_records.append({
-                "索引": idx,
-                "学校名称": row.get("学校名称", ""),
-                "省份": row.get("省份", ""),
-                "招生专业": row.get("招生专业", ""),
-                "一级层次": row.get("一级层次", ""),
-                "招生科类": row.get("招生科类", ""),
-                "招生批次": row.get("招生批次", ""),
-                "招生类型（选填）": row.get("招生类型（选填）", ""),
-                "专业备注（选填）": row.get("专业备注（选填）", ""),  # A表的专业备注字段
-                "候选记录": candidate_records  # 完整的候选记录列表（可能为空）
-            })
+# ======== 图片并发下载 =========
+# 报告页图片多（常有上百张图表），逐张串行请求时每张都要单独建连、握手；
+# 改为共享连接池（keep-alive）的 Session 并发下载，失败按指数退避重试，同一主机的并发数受限
+IMAGE_FETCH_WORKERS = 8
+IMAGE_FETCH_PER_HOST = 4
+IMAGE_FETCH_RETRIES = 3
+IMAGE_FETCH_BACKOFF = 0.5
+IMAGE_FETCH_TIMEOUT = 10
+
+
+def create_http_session(pool_size=IMAGE_FETCH_WORKERS, retries=IMAGE_FETCH_RETRIES, backoff=IMAGE_FETCH_BACKOFF):
+    """带连接池和重试的 Session：连接错误、读超时及 429/5xx 响应按指数退避重试"""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def sniff_image(data):
+    """只解析文件头识别图片格式和尺寸，不解码像素；无法识别时返回 None"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.format, img.size
+    except Exception:
+        return None
 
-    return dfA, manual_fill_records
 
+# ======== 图片本地缓存（跨会话） =========
+# 同一报告页会被反复抓取，同一学校的多个页面也共用横幅、校徽等图片：按 URL 记录 ETag / Last-Modified，
+# 再次抓取时发条件请求，304 直接使用本地内容；图片内容按 SHA-256 去重存放，总大小超过上限时按最近使用时间淘汰
+IMAGE_CACHE_DIR = os.path.join(os.path.abspath("."), ".image_cache")
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
-# ========== 就业质量报告图片提取 ==========
 
-def fetch_images_static(url, output_folder):
-    os.makedirs(output_folder, exist_ok=True)
-    image_paths = []
+def _image_cache_blob_path(cache_dir, digest):
+    return os.path.join(cache_dir, 'blobs', digest)
+
+
+def _image_cache_meta_path(cache_dir, url):
+    return os.path.join(cache_dir, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest() + '.pkl')
+
+
+def _write_file_atomic(path, data):
+    """先写临时文件再替换，多个线程/会话同时写同一文件时不会读到写了一半的内容"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_image_cache(cache_dir, url):
+    """读取 URL 的缓存记录（ETag、Last-Modified、内容哈希）；没有记录或内容已被淘汰时返回 None"""
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        imgs = soup.find_all("img")
-        for idx, img in enumerate(imgs, 1):
-            src = img.get("src")
-            if not src:
-                continue
-            full_url = urljoin(url, src)
-            # 跳过 base64 或 blob 类型
-            if full_url.startswith("data:") or full_url.startswith("blob:"):
+        with open(_image_cache_meta_path(cache_dir, url), 'rb') as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+    if entry.get('url') != url or not os.path.exists(_image_cache_blob_path(cache_dir, entry['digest'])):
+        return None
+    return entry
+
+
+def link_image_cache_data(cache_dir, entry, path):
+    """
+    把缓存的图片内容放到 path：优先建立硬链接（不再复制一份内容），
+    跨文件系统等无法建立硬链接时才复制文件；并刷新内容的最近使用时间
+    """
+    blob_path = _image_cache_blob_path(cache_dir, entry['digest'])
+    try:
+        os.link(blob_path, path)
+    except OSError:
+        shutil.copyfile(blob_path, path)
+    os.utime(blob_path)
+    return path
+
+
+def write_image_cache(cache_dir, url, data, headers):
+    """保存图片内容（相同内容只存一份）及 URL 的缓存记录，返回缓存记录"""
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = _image_cache_blob_path(cache_dir, digest)
+    if os.path.exists(blob_path):
+        os.utime(blob_path)
+    else:
+        _write_file_atomic(blob_path, data)
+    entry = {
+        'url': url,
+        'digest': digest,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+    }
+    _write_file_atomic(_image_cache_meta_path(cache_dir, url), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    return entry
+
+
+def prune_image_cache(cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """按最近使用时间淘汰图片内容，使缓存总大小不超过 max_bytes，并删除内容已被淘汰的 URL 记录；返回淘汰的文件数"""
+    evicted = _prune_lru_files(os.path.join(cache_dir, 'blobs'), max_bytes)
+
+    if evicted:
+        url_dir = os.path.join(cache_dir, 'urls')
+        for item in os.scandir(url_dir):
+            try:
+                with open(item.path, 'rb') as f:
+                    digest = pickle.load(f)['digest']
+                if not os.path.exists(_image_cache_blob_path(cache_dir, digest)):
+                    os.remove(item.path)
+            except Exception:
                 continue
-            ext = os.path.splitext(urlparse(full_url).path)[1] or ".jpg"
-            filename = f"img_{idx:03d}{ext}"
-            path = os.path.join(output_folder, filename)
+    return evicted
+
+
+def _download_image(session, full_url, path, host_limit, cache_dir=None):
+    """
+    下载单张图片并保存，仅保存状态码 200、内容类型为图片且能被识别的数据；
+    成功返回（保存路径, 内容 SHA-256），否则返回 None。
+    cache_dir 不为 None 时使用本地缓存：有缓存记录则发条件请求，304 时直接使用缓存内容；
+    图片内容只在缓存中存一份，path 为指向缓存内容的硬链接。
+    """
+    try:
+        entry = read_image_cache(cache_dir, full_url) if cache_dir else None
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        with host_limit:
+            img_resp = session.get(full_url, timeout=IMAGE_FETCH_TIMEOUT, headers=headers)
+        if entry and img_resp.status_code == 304:
+            return link_image_cache_data(cache_dir, entry, path), entry['digest']
+        if img_resp.status_code != 200:
+            return None
+        content_type = img_resp.headers.get("content-type", "")
+        # 仅保存真正的图片类型
+        if not content_type.startswith("image/"):
+            return None
+        img_data = img_resp.content
+        # 验证图片是否可识别（只解析文件头）
+        if sniff_image(img_data) is None:
+            return None
+        if cache_dir:
             try:
-                img_resp = requests.get(full_url, timeout=10)
-                if img_resp.status_code != 200:
-                    continue
-                content_type = img_resp.headers.get("content-type", "")
-                # 仅保存真正的图片类型
-                if not content_type.startswith("image/"):
+                entry = write_image_cache(cache_dir, full_url, img_data, img_resp.headers)
+                return link_image_cache_data(cache_dir, entry, path), entry['digest']
+            except OSError as e:
+                logging.warning(f"图片缓存写入失败：{e}")
+        with open(path, "wb") as f:
+            f.write(img_data)
+        return path, hashlib.sha256(img_data).hexdigest()
+    except Exception:
+        return None
+
+
+def fetch_images_static(url, output_folder, workers=IMAGE_FETCH_WORKERS, per_host=IMAGE_FETCH_PER_HOST,
+                        cache_dir=IMAGE_CACHE_DIR):
+    """
+    抓取网页中的全部 <img> 并发下载到 output_folder，返回按页面顺序（img_{idx:03d}）排列的（图片路径, 内容 SHA-256）。
+    内容哈希在下载时已经算出，预览缩略图直接用它作缓存键；cache_dir 为 None 时不使用本地图片缓存。
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    try:
+        with create_http_session(pool_size=max(workers, 1)) as session:
+            resp = session.get(url, timeout=IMAGE_FETCH_TIMEOUT)
+            resp.raise_for_status()
+            soup = BeautifulSoup(resp.text, "html.parser")
+            imgs = soup.find_all("img")
+
+            tasks = []
+            for idx, img in enumerate(imgs, 1):
+                src = img.get("src")
+                if not src:
                     continue
-                img_data = img_resp.content
-                # 验证图片是否可识别
-                try:
-                    Image.open(io.BytesIO(img_data))
-                except Exception:
+                full_url = urljoin(url, src)
+                # 跳过 base64 或 blob 类型
+                if full_url.startswith("data:") or full_url.startswith("blob:"):
                     continue
-                with open(path, "wb") as f:
-                    f.write(img_data)
-                image_paths.append(path)
-            except Exception:
-                continue
+                ext = os.path.splitext(urlparse(full_url).path)[1] or ".jpg"
+                filename = f"img_{idx:03d}{ext}"
+                tasks.append((full_url, os.path.join(output_folder, filename)))
+
+            # 每个主机一个信号量，限制对同一主机的并发请求数
+            host_limits = {}
+            for full_url, _ in tasks:
+                host = urlparse(full_url).netloc
+                if host not in host_limits:
+                    host_limits[host] = threading.BoundedSemaphore(max(per_host, 1))
+
+            if not tasks:
+                return []
+            with ThreadPoolExecutor(max_workers=max(min(workers, len(tasks)), 1)) as executor:
+                results = list(executor.map(
+                    lambda task: _download_image(session, task[0], task[1], host_limits[urlparse(task[0]).netloc],
+                                                 cache_dir),
+                    tasks))
     except Exception as e:
         raise Exception(f"静态模式加载失败: {e}")
-    return image_paths
+    if cache_dir:
+        prune_image_cache(cache_dir)
+    # executor.map 按提交顺序返回，即保持图片在页面中的顺序
+    return [result for result in results if result is not None]
+
+
+# ======== 图片合成 PDF =========
+# 逐页写入：JPEG/PNG 由 PyMuPDF 直接嵌入文件数据，不解码为 RGB，也不把全部图片同时留在内存中
+PDF_PASSTHROUGH_FORMATS = ('JPEG', 'PNG')
+PDF_IMAGE_MAX_SIDE = None  # 图片长边上限（像素），None 表示不缩小
+PDF_JPEG_QUALITY = 85
+# 预览缩略图长边像素（预览网格按 120 宽显示，取 2 倍以适配高分屏）及缓存条数
+IMAGE_THUMBNAIL_SIDE = 240
+IMAGE_THUMBNAIL_CACHE_SIZE = 1024
+
+
+def _encode_pdf_image(img, max_side, jpeg_quality):
+    """转码为可嵌入 PDF 的数据：需要缩小时按长边 max_side 缩小并以 JPEG 重新压缩，否则转为 PNG"""
+    buffer = io.BytesIO()
+    if max_side:
+        # JPEG 可按目标尺寸直接降采样解码，避免先解码出全尺寸图片
+        img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side))
+        img.save(buffer, format='JPEG', quality=jpeg_quality)
+    else:
+        img.convert('RGB').save(buffer, format='PNG')
+    return buffer.getvalue()
 
 
-def images_to_pdf(image_paths, pdf_path):
-    images = []
-    for path in sorted(image_paths):
-        try:
-            img = Image.open(path).convert("RGB")
-            images.append(img)
-        except Exception:
-            continue
-    if images:
-        images[0].save(pdf_path, save_all=True, append_images=images[1:])
+@st.cache_resource(show_spinner=False, max_entries=IMAGE_THUMBNAIL_CACHE_SIZE)
+def image_thumbnail(digest, _path, max_side=IMAGE_THUMBNAIL_SIDE):
+    """
+    预览用缩略图（JPEG 数据），按下载时算出的图片内容哈希缓存（临时目录路径每次抓取都不同，不参与缓存键）：
+    JPEG 按目标尺寸降采样解码，不解码全尺寸图片。预览网格只显示缩略图，原图数据仍只由 images_to_pdf 直接嵌入 PDF。
+    """
+    with Image.open(_path) as img:
+        img.draft('RGB', (max_side, max_side))
+        thumb = img.convert('RGB')
+    thumb.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    thumb.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def images_to_pdf(image_paths, pdf_path, max_side=PDF_IMAGE_MAX_SIDE, jpeg_quality=PDF_JPEG_QUALITY):
+    """
+    按路径排序后每张图片一页合成 PDF，页面大小为图片像素尺寸（与原 Pillow 72 DPI 输出一致），无法识别的图片跳过。
+    max_side 不为 None 时，长边超过该像素数的图片先缩小并以 JPEG（jpeg_quality）重新压缩，页面大小不变。
+    """
+    doc = pymupdf.open()
+    try:
+        for path in sorted(image_paths):
+            try:
+                with Image.open(path) as img:
+                    width, height = img.size
+                    if max_side and max(width, height) > max_side:
+                        stream = _encode_pdf_image(img, max_side, jpeg_quality)
+                    elif img.format in PDF_PASSTHROUGH_FORMATS:
+                        stream = None
+                    else:
+                        stream = _encode_pdf_image(img, None, jpeg_quality)
+            except Exception:
+                continue
+            page = doc.new_page(width=width, height=height)
+            try:
+                if stream is None:
+                    page.insert_image(page.rect, filename=path)
+                else:
+                    page.insert_image(page.rect, stream=stream)
+            except Exception:
+                doc.delete_page(-1)
+                continue
+        if doc.page_count == 0:
+            return False
+        doc.save(pdf_path, deflate=True)
         return True
-    return False
+    finally:
+        doc.close()
 
 
 # ============================
@@ -1629,102 +1762,229 @@ def generate_plan_college_key(item):
     return f"{province}|{school}|{subject}|{batch}|{group_code}|{recruit_code}"
 
 
+# 组合键字段（顺序与 generate_plan_score_key / generate_plan_college_key 一致）
+PLAN_SCORE_KEY_FIELDS = ['年份', '省份', '学校', '科类', '批次', '专业', '层次', '专业组代码']
+PLAN_COLLEGE_KEY_FIELDS = ['省份', '学校', '科类', '批次', '专业组代码', '招生代码']
+
+# 比对结果表的列：结果列名 -> 招生计划中的来源列名
+PLAN_SCORE_RESULT_FIELDS = {
+    '年份': '年份', '省份': '省份', '学校': '学校', '科类': '科类', '批次': '批次',
+    '专业': '专业', '层次': '层次', '专业组代码': '专业组代码',
+    '招生人数': '招生人数', '学费': '学费', '学制': '学制', '专业代码': '专业代码',
+    '招生代码': '招生代码', '数据来源': '数据来源', '备注': '备注', '招生类型': '招生类型',
+    '专业组选科要求': '专业组选科要求', '专业选科要求': '专业选科要求(新高考专业省份)'
+}
+PLAN_COLLEGE_RESULT_FIELDS = {
+    '省份': '省份', '学校': '学校', '层次': '层次', '科类': '科类', '批次': '批次',
+    '专业组代码': '专业组代码', '招生代码': '招生代码',
+    '年份': '年份', '专业': '专业', '招生人数': '招生人数', '学费': '学费', '学制': '学制',
+    '专业代码': '专业代码', '数据来源': '数据来源', '备注': '备注', '招生类型': '招生类型',
+    '专业组选科要求': '专业组选科要求', '专业选科要求': '专业选科要求(新高考专业省份)'
+}
+
+
+def map_field_values(df, field, func):
+    """
+    按列对字段逐值执行 func，等价于逐行的 func(item.get(field, ''))。
+    先对列做 factorize，只对去重后的取值调用 func，再按编码展开回整列；字段不存在时整列为 func('')。
+    """
+    if field not in df.columns:
+        return np.full(len(df), func(''), dtype=object)
+    codes, uniques = pd.factorize(df[field], use_na_sentinel=False)
+    converted = np.empty(len(uniques), dtype=object)
+    for i, value in enumerate(np.asarray(uniques, dtype=object)):
+        converted[i] = func(value)
+    return converted[codes]
+
+
+def plan_field_values(df, field, as_key=False):
+    """
+    按列取字段值，等价于逐行的 item.get(field, '') or ''；
+    as_key=True 时再转换为去除首尾空白的字符串（与组合键生成规则一致）。
+    """
+    if as_key:
+        return map_field_values(df, field, lambda value: str(value or '').strip())
+    return map_field_values(df, field, lambda value: value or '')
+
+
+def build_composite_keys(df, key_fields):
+    """按列拼接组合键（字段间以 | 分隔），返回与 df 等长的字符串 Series"""
+    keys = pd.Series(plan_field_values(df, key_fields[0], as_key=True), index=df.index, dtype=object)
+    for field in key_fields[1:]:
+        keys = keys + '|' + plan_field_values(df, field, as_key=True)
+    return keys
+
+
+# ======== 参考文件组合键索引（按文件内容寻址的本地缓存） =========
+# 同一份专业分/院校分文件会被反复用来比对不同的招生计划，按文件内容哈希缓存其组合键，
+# 再次上传相同文件时直接读取索引，不再解析 xlsx 和生成组合键
+PLAN_KEY_INDEX_DIR = os.path.join(os.path.abspath("."), ".plan_key_index")
+PLAN_KEY_INDEX_MAX_BYTES = 256 * 1024 * 1024
+# 组合键生成规则（build_composite_keys / plan_field_values）变化时递增，旧索引自动失效
+PLAN_KEY_INDEX_VERSION = 1
+PLAN_KEY_INDEX_FIELDS = {
+    'score': PLAN_SCORE_KEY_FIELDS,
+    'college': PLAN_COLLEGE_KEY_FIELDS,
+}
+
+
+def build_plan_key_index(df, kind):
+    """
+    为参考文件（kind='score' 专业分 / 'college' 院校分）生成组合键索引：
+    keys 为去重后的组合键，row_count 为文件记录数
+    """
+    keys = build_composite_keys(df, PLAN_KEY_INDEX_FIELDS[kind]).unique()
+    return {
+        'kind': kind,
+        'keys': np.asarray(keys, dtype=object),
+        'row_count': len(df),
+    }
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_plan_key_index(kind, digest, _file_bytes):
+    """
+    按内容哈希加载组合键索引：本地索引存在则直接读取（并刷新最近使用时间），否则解析文件并写入索引；
+    索引目录总大小超过 PLAN_KEY_INDEX_MAX_BYTES 时按最近使用时间淘汰
+    """
+    index_path = os.path.join(PLAN_KEY_INDEX_DIR, f"{kind}-{digest}.pkl")
+    signature = (kind, tuple(PLAN_KEY_INDEX_FIELDS[kind]), PLAN_KEY_INDEX_VERSION)
+    index = _read_reference_snapshot(index_path, signature, value_type=dict)
+    if index is not None:
+        logging.info(f"命中组合键索引：{kind}-{digest[:12]}，{index['row_count']} 条记录")
+        try:
+            os.utime(index_path)
+        except OSError:
+            pass
+        return index
+    df = pd.read_excel(BytesIO(_file_bytes), engine='openpyxl')
+    index = build_plan_key_index(df, kind)
+    try:
+        os.makedirs(PLAN_KEY_INDEX_DIR, exist_ok=True)
+    except OSError as e:
+        logging.warning(f"创建组合键索引目录失败：{e}")
+        return index
+    _write_reference_snapshot(index_path, signature, index)
+    _prune_lru_files(PLAN_KEY_INDEX_DIR, PLAN_KEY_INDEX_MAX_BYTES, suffix='.pkl')
+    return index
+
+
+def load_plan_key_index(file_bytes, kind):
+    """加载上传的参考文件的组合键索引（进程内缓存 → 本地索引 → 解析 xlsx）"""
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return _load_plan_key_index(kind, digest, file_bytes)
+
+
+def plan_reference_keys(reference, key_fields):
+    """取参考数据的去重组合键：reference 可以是 DataFrame，也可以是 load_plan_key_index 返回的索引"""
+    if isinstance(reference, dict):
+        return reference['keys']
+    return build_composite_keys(reference, key_fields).unique()
+
+
+def match_plan_keys(plan_df, reference, key_fields, plan_digest=None):
+    """
+    比对产物：招生计划每行是否存在于参考数据中的布尔掩码 exists。
+    比对阶段生成一次，页面展示和导出直接按掩码取行，不再重复生成组合键。
+    plan_digest 为招生计划文件内容的哈希，用于判断比对产物是否仍对应当前上传的招生计划。
+    """
+    plan_keys = build_composite_keys(plan_df, key_fields)
+    reference_keys = plan_reference_keys(reference, key_fields)
+    return {
+        'exists': plan_keys.isin(reference_keys).to_numpy(),
+        'plan_digest': plan_digest,
+        'reference_keys': reference_keys,
+    }
+
+
+def is_plan_match_current(match, plan_df, reference, key_fields, plan_digest=None):
+    """
+    判断比对产物是否仍对应当前的招生计划（文件内容哈希一致）和参考数据（同一份组合键索引）。
+    未提供 plan_digest 时无法确认招生计划未变化，视为不一致。
+    """
+    return (
+        match is not None
+        and plan_digest is not None
+        and match['plan_digest'] == plan_digest
+        and len(match['exists']) == len(plan_df)
+        and isinstance(reference, dict)
+        and match['reference_keys'] is plan_reference_keys(reference, key_fields)
+    )
+
+
+def compare_plan_keys(plan_df, reference, key_fields, result_fields, match=None):
+    """
+    列式比对引擎：按列生成招生计划的组合键，用一次 isin 判断每行的组合键是否存在于参考数据中，
+    返回结果表（每行对应招生计划一行）：
+    index（从1开始的序号）、originalIndex（招生计划中的行号）、result_fields 中的各列、exists（是否存在）
+    已有比对产物 match 时直接使用其掩码。
+    """
+    if match is None:
+        match = match_plan_keys(plan_df, reference, key_fields)
+
+    result = pd.DataFrame({
+        'index': plan_df.index + 1,
+        'originalIndex': plan_df.index,
+    })
+    for column, source in result_fields.items():
+        result[column] = plan_field_values(plan_df, source)
+    result['exists'] = match['exists']
+    return result
+
+
 def compare_plan_vs_score(plan_df, score_df):
-    """比对招生计划 vs 专业分"""
-    plan_score_results = []
-    score_key_set = set()
-
-    # 为专业分数据建立索引
-    for _, item in score_df.iterrows():
-        key = generate_plan_score_key(item.to_dict())
-        score_key_set.add(key)
-
-    # 比对招生计划数据
-    for idx, row in plan_df.iterrows():
-        item = row.to_dict()
-        key = generate_plan_score_key(item)
-        exists = key in score_key_set
-
-        plan_score_results.append({
-            'index': idx + 1,
-            'originalIndex': idx,
-            'keyFields': {
-                '年份': item.get('年份', '') or '',
-                '省份': item.get('省份', '') or '',
-                '学校': item.get('学校', '') or '',
-                '科类': item.get('科类', '') or '',
-                '批次': item.get('批次', '') or '',
-                '专业': item.get('专业', '') or '',
-                '层次': item.get('层次', '') or '',
-                '专业组代码': item.get('专业组代码', '') or ''
-            },
-            'exists': exists,
-            'otherInfo': {
-                '招生人数': item.get('招生人数', '') or '',
-                '学费': item.get('学费', '') or '',
-                '学制': item.get('学制', '') or '',
-                '专业代码': item.get('专业代码', '') or '',
-                '招生代码': item.get('招生代码', '') or '',
-                '数据来源': item.get('数据来源', '') or '',
-                '备注': item.get('备注', '') or '',
-                '招生类型': item.get('招生类型', '') or '',
-                '专业组选科要求': item.get('专业组选科要求', '') or '',
-                '专业选科要求': item.get('专业选科要求(新高考专业省份)', '') or ''
-            }
-        })
+    """比对招生计划 vs 专业分（score_df 可以是专业分 DataFrame 或其组合键索引）"""
+    return compare_plan_keys(plan_df, score_df, PLAN_SCORE_KEY_FIELDS, PLAN_SCORE_RESULT_FIELDS)
+
+
+def compare_plan_vs_college(plan_df, college_df, match=None):
+    """比对招生计划 vs 院校分（college_df 可以是院校分 DataFrame 或其组合键索引）"""
+    return compare_plan_keys(plan_df, college_df, PLAN_COLLEGE_KEY_FIELDS, PLAN_COLLEGE_RESULT_FIELDS, match)
+
+
+def count_plan_matched(results):
+    """统计比对结果中匹配的记录数"""
+    if len(results) == 0:
+        return 0
+    return int(results['exists'].sum())
+
+
+def unmatched_plan_indices(results):
+    """返回比对结果中未匹配记录在招生计划中的行号集合"""
+    if len(results) == 0:
+        return set()
+    return set(results.loc[~results['exists'], 'originalIndex'].tolist())
 
-    return plan_score_results
-
-
-def compare_plan_vs_college(plan_df, college_df):
-    """比对招生计划 vs 院校分"""
-    plan_college_results = []
-    college_key_set = set()
-
-    # 为院校分数据建立索引
-    for _, item in college_df.iterrows():
-        key = generate_plan_college_key(item.to_dict())
-        college_key_set.add(key)
-
-    # 比对招生计划数据
-    for idx, row in plan_df.iterrows():
-        item = row.to_dict()
-        key = generate_plan_college_key(item)
-        exists = key in college_key_set
-
-        plan_college_results.append({
-            'index': idx + 1,
-            'originalIndex': idx,
-            'keyFields': {
-                '省份': item.get('省份', '') or '',
-                '学校': item.get('学校', '') or '',
-                '层次': item.get('层次', '') or '',
-                '科类': item.get('科类', '') or '',
-                '批次': item.get('批次', '') or '',
-                '专业组代码': item.get('专业组代码', '') or '',
-                '招生代码': item.get('招生代码', '') or ''
-            },
-            'exists': exists,
-            'otherInfo': {
-                '年份': item.get('年份', '') or '',
-                '专业': item.get('专业', '') or '',
-                '层次': item.get('层次', '') or '',
-                '招生人数': item.get('招生人数', '') or '',
-                '学费': item.get('学费', '') or '',
-                '学制': item.get('学制', '') or '',
-                '专业代码': item.get('专业代码', '') or '',
-                '数据来源': item.get('数据来源', '') or '',
-                '备注': item.get('备注', '') or '',
-                '招生类型': item.get('招生类型', '') or '',
-                '专业组选科要求': item.get('专业组选科要求', '') or '',
-                '专业选科要求': item.get('专业选科要求(新高考专业省份)', '') or ''
-            }
-        })
 
-    return plan_college_results
+def build_plan_result_table(results, columns, dash_columns=(), status_labels=('存在', '不存在')):
+    """由比对结果表生成页面展示/导出用的表格：序号 + 指定列 + 匹配状态，dash_columns 中的空值显示为 -"""
+    table = pd.DataFrame({'序号': results['index'].to_numpy()})
+    for column in columns:
+        values = results[column].to_numpy()
+        if column in dash_columns:
+            values = np.where(values == '', '-', values)
+        table[column] = values
+    table['匹配状态'] = np.where(results['exists'].to_numpy(), *status_labels)
+    return table
 
 
-def filter_unmatched_plan_data_for_college_export(plan_df, college_df):
+def build_plan_score_export(results):
+    """比对1（招生计划 vs 专业分）导出表"""
+    table = build_plan_result_table(
+        results, ['年份', '省份', '学校', '科类', '批次', '专业', '层次', '专业组代码', '招生人数', '学费', '学制', '专业代码'])
+    table['匹配说明'] = np.where(results['exists'].to_numpy(), '该记录在专业分文件中存在', '该记录在专业分文件中不存在')
+    return table
+
+
+def build_plan_college_export(results):
+    """比对2（招生计划 vs 院校分）导出表"""
+    table = build_plan_result_table(
+        results, ['年份', '省份', '学校', '科类', '批次', '专业组代码', '招生代码', '专业', '层次', '招生人数'])
+    table['匹配说明'] = np.where(results['exists'].to_numpy(), '该记录在院校分文件中存在', '该记录在院校分文件中不存在')
+    return table
+
+
+def filter_unmatched_plan_data_for_college_export(plan_df, college_df, match=None, plan_digest=None):
     """
     过滤出招生计划中不存在于院校分中的数据。
     
@@ -1733,30 +1993,16 @@ def filter_unmatched_plan_data_for_college_export(plan_df, college_df):
     - 只导出招生计划中，这几个字段的组合键不存在的内容
     - 注意：招生计划中可能存在多个相同的组合键，只要院校分存在一个，就不导出
     
-    返回：未匹配的招生计划记录列表
-    """
-    unmatched_records = []
-    
-    # 为院校分数据建立组合键集合
-    college_key_set = set()
-    for _, item in college_df.iterrows():
-        key = generate_plan_college_key(item.to_dict())
-        college_key_set.add(key)
+    match 为比对2生成的比对产物（match_plan_keys 的返回值），plan_digest 为当前招生计划文件内容的哈希；
+    比对产物仍对应当前数据时直接按掩码取行，否则重新比对一次。
     
-    # 遍历招生计划，找出未匹配的记录（保留所有未匹配行，以便后续按组合键汇总招生人数）
-    for idx, row in plan_df.iterrows():
-        item = row.to_dict()
-        key = generate_plan_college_key(item)
-
-        # 只要组合键不在院校分集中，就把该行加入未匹配列表（保留重复组合键）
-        if key not in college_key_set:
-            unmatched_records.append({
-                'index': idx + 1,
-                'originalIndex': idx,
-                'data': item
-            })
-    
-    return unmatched_records
+    返回：未匹配的招生计划行（plan_df 按位置选取的 DataFrame，保留原索引，包括重复组合键的行）
+    """
+    if not is_plan_match_current(match, plan_df, college_df, PLAN_COLLEGE_KEY_FIELDS, plan_digest):
+        match = match_plan_keys(plan_df, college_df, PLAN_COLLEGE_KEY_FIELDS, plan_digest)
+
+    # 保留所有未匹配行（包括重复组合键），以便后续按组合键汇总招生人数
+    return plan_df.iloc[np.flatnonzero(~match['exists'])]
 
 
 def get_first_subject(category):
@@ -1795,7 +2041,6 @@ def extract_required_subjects(text):
     }
 
     # 清理文本，保留中文和顿号、逗号
-    import re
     clean_text = re.sub(r'[^\u4e00-\u9fa5、，,]', '', str(text)).strip()
 
     # 处理"物化生（3科必选）"格式：直接提取括号前的内容
@@ -1841,8 +2086,6 @@ def extract_required_subjects_with_format(text):
     if not text:
         return ''
     
-    import re
-    
     # 处理"物化生（3科必选）"或"物、化、生（3科必选）"或"生、化、物（3科必选）"格式
     # 支持中文括号（、）和英文括号()
     extracted_text = ''
@@ -1889,13 +2132,18 @@ def extract_required_subjects_with_format(text):
 
 def convert_selection_requirement(group_requirement, major_requirement):
     """转换选科要求"""
-    selection_requirement = ''
-    second_subject = ''
-
     # 合并两个要求字段（专业组选科要求和专业选科要求）
     group_req_str = str(group_requirement).strip() if group_requirement else ''
     major_req_str = str(major_requirement).strip() if major_requirement else ''
-    
+    return _convert_selection_requirement_text(group_req_str, major_req_str)
+
+
+@lru_cache(maxsize=4096)
+def _convert_selection_requirement_text(group_req_str, major_req_str):
+    """按清理后的两个要求字符串转换选科要求；不同的要求组合通常只有几百种，结果按字符串缓存"""
+    selection_requirement = ''
+    second_subject = ''
+
     # 如果两个字段都有内容，用顿号连接
     if group_req_str and major_req_str:
         requirement = group_req_str + '、' + major_req_str
@@ -1903,7 +2151,6 @@ def convert_selection_requirement(group_requirement, major_requirement):
         requirement = group_req_str + major_req_str
 
     # 清理特殊字符
-    import re
     requirement = re.sub(r'^\^+', '', requirement).replace('^', '、').strip()
 
     if not requirement or requirement == '' or requirement == '、':
@@ -1980,155 +2227,162 @@ def convert_to_text(value):
     return text
 
 
-def convert_data(source_data):
-    """转换数据主函数"""
-    converted = []
-
-    for row in source_data:
-        new_row = {}
-
-        # 基础字段映射
-        new_row['学校名称'] = row.get('学校', '') or ''
-        new_row['省份'] = row.get('省份', '') or ''
-        new_row['招生专业'] = row.get('专业', '') or ''
-        new_row['招生科类'] = row.get('科类', '') or ''
-        new_row['招生批次'] = row.get('批次', '') or ''
-        new_row['招生类型（选填）'] = row.get('招生类型', '') or ''
-        new_row['专业备注（选填）'] = row.get('备注', '') or ''
-        new_row['招生人数（选填）'] = row.get('招生人数', '') or ''
-        new_row['数据来源'] = row.get('数据来源', '') or ''
-
-        # 处理层次字段
-        new_row['一级层次'] = convert_level(row.get('层次', ''))
-
-        # 处理代码字段（保持文本格式）
-        new_row['招生代码'] = convert_to_text(row.get('招生代码', ''))
-        new_row['专业代码'] = convert_to_text(row.get('专业代码', ''))
-        new_row['专业组代码'] = convert_to_text(row.get('专业组代码', ''))
-
-        # 处理首选科目
-        new_row['首选科目'] = get_first_subject(row.get('科类', ''))
-
-        # 处理选科要求
-        selection_requirement, second_subject = convert_selection_requirement(
-            row.get('专业组选科要求', ''),
-            row.get('专业选科要求(新高考专业省份)', '')
-        )
-        new_row['选科要求'] = selection_requirement
-        new_row['次选科目'] = second_subject
-
-        # 其他字段（留空）
-        new_row['专业方向（选填）'] = ''
-        new_row['最高分'] = ''
-        new_row['最低分'] = ''
-        new_row['平均分'] = ''
-        new_row['最低分位次（选填）'] = ''
-        new_row['最低分数区间低'] = ''
-        new_row['最低分数区间高'] = ''
-        new_row['最低分数区间位次低'] = ''
-        new_row['最低分数区间位次高'] = ''
-        new_row['录取人数（选填）'] = ''
-
-        converted.append(new_row)
+# 专业分模板（第3行标题行）的26列
+MAJOR_SCORE_HEADERS = [
+    '学校名称', '省份', '招生专业', '专业方向（选填）', '专业备注（选填）',
+    '一级层次', '招生科类', '招生批次', '招生类型（选填）', '最高分',
+    '最低分', '平均分', '最低分位次（选填）', '招生人数（选填）',
+    '数据来源', '专业组代码', '首选科目', '选科要求', '次选科目',
+    '专业代码', '招生代码', '最低分数区间低', '最低分数区间高',
+    '最低分数区间位次低', '最低分数区间位次高', '录取人数（选填）'
+]
 
+
+def convert_selection_requirement_columns(df):
+    """
+    convert_selection_requirement 的列式版本：对（专业组选科要求, 专业选科要求）的每种不同组合只转换一次，
+    再按组合编码展开回整列，返回（选科要求, 次选科目）两个数组
+    """
+    group_codes, group_values = pd.factorize(
+        df['专业组选科要求'] if '专业组选科要求' in df.columns else pd.Series('', index=df.index),
+        use_na_sentinel=False)
+    major_codes, major_values = pd.factorize(
+        df['专业选科要求(新高考专业省份)'] if '专业选科要求(新高考专业省份)' in df.columns
+        else pd.Series('', index=df.index),
+        use_na_sentinel=False)
+    pair_codes, pairs = pd.factorize(group_codes.astype(np.int64) * len(major_values) + major_codes)
+
+    group_values = np.asarray(group_values, dtype=object)
+    major_values = np.asarray(major_values, dtype=object)
+    selection = np.empty(len(pairs), dtype=object)
+    second = np.empty(len(pairs), dtype=object)
+    for i, pair in enumerate(pairs):
+        group_code, major_code = divmod(int(pair), len(major_values))
+        selection[i], second[i] = convert_selection_requirement(group_values[group_code], major_values[major_code])
+    return selection[pair_codes], second[pair_codes]
+
+
+def convert_data(source_data):
+    """转换数据主函数：将招生计划数据（记录列表或 DataFrame）按列转换为专业分格式的 DataFrame"""
+    df = source_data if isinstance(source_data, pd.DataFrame) else pd.DataFrame(list(source_data))
+    converted = pd.DataFrame('', index=range(len(df)), columns=MAJOR_SCORE_HEADERS, dtype=object)
+    if len(df) == 0:
+        return converted
+
+    # 基础字段映射
+    converted['学校名称'] = plan_field_values(df, '学校')
+    converted['省份'] = plan_field_values(df, '省份')
+    converted['招生专业'] = plan_field_values(df, '专业')
+    converted['招生科类'] = plan_field_values(df, '科类')
+    converted['招生批次'] = plan_field_values(df, '批次')
+    converted['招生类型（选填）'] = plan_field_values(df, '招生类型')
+    converted['专业备注（选填）'] = plan_field_values(df, '备注')
+    converted['招生人数（选填）'] = plan_field_values(df, '招生人数')
+    converted['数据来源'] = plan_field_values(df, '数据来源')
+
+    # 处理层次字段
+    converted['一级层次'] = map_field_values(df, '层次', convert_level)
+
+    # 处理代码字段（保持文本格式）
+    converted['招生代码'] = map_field_values(df, '招生代码', convert_to_text)
+    converted['专业代码'] = map_field_values(df, '专业代码', convert_to_text)
+    converted['专业组代码'] = map_field_values(df, '专业组代码', convert_to_text)
+
+    # 处理首选科目
+    converted['首选科目'] = map_field_values(df, '科类', get_first_subject)
+
+    # 处理选科要求
+    converted['选科要求'], converted['次选科目'] = convert_selection_requirement_columns(df)
+
+    # 其他字段留空
     return converted
 
 
+# 院校分模板（第3行标题行）的21列
+COLLEGE_SCORE_HEADERS = ['学校名称', '省份', '招生类别', '招生批次', '招生类型', '选测等级',
+                         '最高分', '最低分', '平均分', '最高位次', '最低位次', '平均位次',
+                         '录取人数', '招生人数', '数据来源', '省控线科类', '省控线批次', '省控线备注',
+                         '专业组代码', '首选科目', '院校招生代码']
+
+
+def safe_str_column(df, field, lstrip_chars=None):
+    """
+    按列将字段转换为去除首尾空白的字符串：None、NaN 以及 'nan'、'None' 等字符串转换为空字符串；
+    字段不存在时整列为空字符串。lstrip_chars 不为空时再去掉开头的这些字符。
+    先对列做 factorize，只对去重后的取值做转换，再按编码展开回整列。
+    """
+    if field not in df.columns:
+        return np.full(len(df), '', dtype=object)
+    codes, uniques = pd.factorize(df[field], use_na_sentinel=False)
+    converted = np.empty(len(uniques), dtype=object)
+    for i, value in enumerate(np.asarray(uniques, dtype=object)):
+        value_str = '' if value is None or pd.isna(value) else str(value).strip()
+        if value_str.lower() in ['nan', 'none']:
+            value_str = ''
+        converted[i] = value_str.lstrip(lstrip_chars) if lstrip_chars else value_str
+    return converted[codes]
+
+
 def convert_to_college_score_format(conversion_data):
-    """将招生计划数据转换为院校分格式"""
-    if not conversion_data:
+    """将招生计划数据（记录列表或 DataFrame）转换为院校分格式"""
+    if len(conversion_data) == 0:
         return []
 
-    # 辅助函数：安全地处理空值，将None、NaN等转换为空字符串
-    def safe_str(value, default=''):
-        """安全地将值转换为字符串，处理None、NaN等情况"""
-        if value is None:
-            return default
-        if pd.isna(value):
-            return default
-        value_str = str(value).strip()
-        # 检查是否为'nan'、'None'等字符串
-        if value_str.lower() in ['nan', 'none', '']:
-            return default
-        return value_str
-
-    # 构建分组键：学校、省份、层次、科类、批次、专业组代码、招生代码
+    df = conversion_data if isinstance(conversion_data, pd.DataFrame) else pd.DataFrame(conversion_data)
+
+    # 构建分组键：学校、省份、层次、科类、批次、专业组代码、招生代码（专业组代码与招生代码去掉开头的^）
     # 所有字段缺失时使用空字符串，占位保持一致
-    def get_group_key(item):
-        school = safe_str(item.get('学校', ''))
-        province = safe_str(item.get('省份', ''))
-        level = safe_str(item.get('层次', ''))
-        subject = safe_str(item.get('科类', ''))
-        batch = safe_str(item.get('批次', ''))
-        group_code = safe_str(item.get('专业组代码', '')).lstrip('^')
-        recruit_code = safe_str(item.get('招生代码', '')).lstrip('^')
-        return (school, province, level, subject, batch, group_code, recruit_code)
-
-    # 按分组键分组
-    grouped_data = {}
-    for item in conversion_data:
-        key = get_group_key(item)
-        if key not in grouped_data:
-            grouped_data[key] = []
-        grouped_data[key].append(item)
-
-    # 转换为院校分格式
-    college_score_data = []
-    for key, items in grouped_data.items():
-        # items 是同一组合键下的所有原始记录，取第一条作为基础记录用于填充其他字段
-        base_item = items[0]
-
-        # 计算该组合键下的招生人数总和（忽略无法转换的值）
-        total_recruit_num = 0.0
-        for item in items:
-            recruit_num = item.get('招生人数', '')
-            if recruit_num is None or (isinstance(recruit_num, str) and recruit_num.strip() == ''):
-                continue
-            try:
-                total_recruit_num += float(str(recruit_num))
-            except:
-                continue
+    keys = pd.DataFrame({
+        '学校': safe_str_column(df, '学校'),
+        '省份': safe_str_column(df, '省份'),
+        '层次': safe_str_column(df, '层次'),
+        '科类': safe_str_column(df, '科类'),
+        '批次': safe_str_column(df, '批次'),
+        '专业组代码': safe_str_column(df, '专业组代码', lstrip_chars='^'),
+        '招生代码': safe_str_column(df, '招生代码', lstrip_chars='^'),
+    })
+    key_columns = list(keys.columns)
+    keys['_position'] = np.arange(len(df))
+    # keys 为从 0 开始的新索引，按位置赋值（调用方传入的 DataFrame 索引可能不连续、乱序）
+    # 招生人数无法转换为数字的值（空值、非数字文本）不计入总和
+    keys['_recruit_num'] = (
+        pd.to_numeric(df['招生人数'], errors='coerce').to_numpy() if '招生人数' in df.columns else np.nan
+    )
+
+    # 按分组键分组（保持首次出现的顺序），取每组第一条记录作为基础记录，并汇总招生人数
+    grouped = keys.groupby(key_columns, sort=False).agg(
+        first_position=('_position', 'first'),
+        total_recruit_num=('_recruit_num', 'sum'),
+    )
+    first_positions = grouped['first_position'].to_numpy()
+    base = keys.iloc[first_positions]
+    total_recruit_num = grouped['total_recruit_num'].to_numpy()
+
+    result = pd.DataFrame('', index=range(len(grouped)), columns=COLLEGE_SCORE_HEADERS, dtype=object)
+    result['学校名称'] = base['学校'].to_numpy()
+    result['省份'] = base['省份'].to_numpy()
+    result['招生类别'] = base['科类'].to_numpy()
+    result['招生批次'] = base['批次'].to_numpy()
+    result['招生类型'] = safe_str_column(df, '招生类型')[first_positions]
+    result['招生人数'] = [
+        str(int(total)) if total > 0 else '' for total in total_recruit_num
+    ]
+    result['数据来源'] = safe_str_column(df, '数据来源')[first_positions]
+    result['专业组代码'] = base['专业组代码'].to_numpy()
+    result['院校招生代码'] = base['招生代码'].to_numpy()
+
+    # 首选科目
+    category = base['科类'].astype(object)
+    result['首选科目'] = np.select(
+        [
+            (category.str.contains('物理类', regex=False) | (category == '物理')).to_numpy(),
+            (category.str.contains('历史类', regex=False) | (category == '历史')).to_numpy(),
+        ],
+        ['物理', '历史'],
+        default=''
+    ).astype(object)
 
-        # 处理专业组代码与招生代码，去掉开头的^并保持空字符串
-        group_code = safe_str(base_item.get('专业组代码', '')).lstrip('^')
-        recruit_code = safe_str(base_item.get('招生代码', '')).lstrip('^')
-
-        recruit_num_str = str(int(total_recruit_num)) if total_recruit_num and total_recruit_num > 0 else ''
-
-        college_record = {
-            '学校名称': safe_str(base_item.get('学校', '')),
-            '省份': safe_str(base_item.get('省份', '')),
-            '招生类别': safe_str(base_item.get('科类', '')),
-            '招生批次': safe_str(base_item.get('批次', '')),
-            '招生类型': safe_str(base_item.get('招生类型', '')),
-            '选测等级': '',
-            '最高分': '',
-            '最低分': '',
-            '平均分': '',
-            '最高位次': '',
-            '最低位次': '',
-            '平均位次': '',
-            '录取人数': '',
-            '招生人数': recruit_num_str,
-            '数据来源': safe_str(base_item.get('数据来源', '')),
-            '省控线科类': '',
-            '省控线批次': '',
-            '省控线备注': '',
-            '专业组代码': group_code,
-            '首选科目': '',
-            '院校招生代码': recruit_code
-        }
-
-        # 首选科目
-        category = college_record['招生类别']
-        if '物理类' in category or category == '物理':
-            college_record['首选科目'] = '物理'
-        elif '历史类' in category or category == '历史':
-            college_record['首选科目'] = '历史'
-
-        college_score_data.append(college_record)
-
-    return college_score_data
+    return result.to_dict('records')
 
 
 def export_college_score_data_to_excel(college_score_data, conversion_data, output_path):
@@ -2148,76 +2402,34 @@ def export_college_score_data_to_excel(college_score_data, conversion_data, outp
 6.录取人数：仅能填写数字
 7.首选科目：新八省必填，只能填写（历史或物理）"""
 
-    # 创建工作簿
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # 第一行：合并A1-U1并写入备注
-    ws.merge_cells('A1:U1')
-    ws['A1'] = remark_text
-    ws['A1'].alignment = Alignment(wrap_text=True, vertical='top')
-    # 设置第一行行高为220磅
-    ws.row_dimensions[1].height = 220
-
-    # 第二行：A2="招生年"，B2=年份，C2="1"，D2="模板类型（模板标识不要更改）"
-    ws['A2'] = '招生年'
     # 从conversion_data中提取年份
     year_value = ''
-    if conversion_data and len(conversion_data) > 0:
-        year_value = conversion_data[0].get('年份', '') or ''
+    if len(conversion_data) > 0:
+        first_row = conversion_data.iloc[0] if isinstance(conversion_data, pd.DataFrame) else conversion_data[0]
+        year_value = first_row.get('年份', '') or ''
         if year_value:
             year_value = str(year_value).strip()
 
-    # B2设置为文本格式
-    ws['B2'] = year_value
-    ws['B2'].number_format = numbers.FORMAT_TEXT
-    ws['C2'] = 1
-    ws['D2'] = '模板类型（模板标识不要更改）'
-
-    # 第三行：标题行
-    headers = ['学校名称', '省份', '招生类别', '招生批次', '招生类型', '选测等级',
-               '最高分', '最低分', '平均分', '最高位次', '最低位次', '平均位次',
-               '录取人数', '招生人数', '数据来源', '省控线科类', '省控线批次', '省控线备注',
-               '专业组代码', '首选科目', '院校招生代码']
-    for col_idx, header in enumerate(headers, start=1):
-        ws.cell(row=3, column=col_idx, value=header)
-
-    # 数据行（从第4行开始）
-    for row_idx, row_data in enumerate(college_score_data, start=4):
-        for col_idx, header in enumerate(headers, start=1):
-            value = row_data.get(header, '')
-
-            # 处理空值：将None、NaN、'nan'字符串等转换为空字符串
-            if value is None or pd.isna(value):
-                value = ''
-            elif isinstance(value, str):
-                # 检查是否为'nan'、'None'等字符串
-                if value.lower() in ['nan', 'none']:
-                    value = ''
-
-            cell = ws.cell(row=row_idx, column=col_idx, value=value)
-
-            # 设置文本格式的列：招生人数、专业组代码、院校招生代码
-            # 这些列需要保持文本格式，即使内容开头为0也不能抹掉
-            if header == '专业组代码' or header == '院校招生代码' or header == '招生人数':
-                # 确保值为字符串格式，并设置为文本格式
-                if value is not None and value != '':
-                    cell.value = str(value)
-                else:
-                    cell.value = ''  # 确保空值写入为空字符串
-                cell.number_format = numbers.FORMAT_TEXT
-
-    wb.save(output_path)
+    # 处理空值：将None、NaN、'nan'字符串等转换为空字符串
+    # 招生人数、专业组代码、院校招生代码需要保持文本格式，即使内容开头为0也不能抹掉
+    text_columns = ['专业组代码', '院校招生代码', '招生人数']
+    clean = {header: _clean_export_value for header in COLLEGE_SCORE_HEADERS}
+    for header in text_columns:
+        clean[header] = lambda value: str(_clean_export_value(value))
+
+    # 第一行：合并A1-U1写入备注，行高220磅；第二行：A2="招生年"，B2=年份（文本格式），C2=1，D2="模板类型（模板标识不要更改）"
+    write_template_workbook(output_path, college_score_data, {
+        'note': remark_text,
+        'header_rows': [['招生年', year_value, 1, '模板类型（模板标识不要更改）']],
+        'text_header_cells': ['B2'],
+        'columns': COLLEGE_SCORE_HEADERS,
+        'clean': clean,
+        'text_columns': text_columns,
+    })
 
 
 def export_converted_data_to_excel(data, conversion_data, output_path):
     """导出转换后的数据为Excel（保持与HTML中相同的格式）"""
-    from datetime import datetime
-
-    # 创建工作簿
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
     # 第1行：备注（合并单元格）
     remark_text = """备注：请删除示例后再填写；
 1.省份：必须填写各省份简称，例如：北京、内蒙古，不能带有市、省、自治区、空格、特殊字符等
@@ -2239,44 +2451,23 @@ def export_converted_data_to_excel(data, conversion_data, output_path):
 12.新八省首选科目必须选择（物理或历史）
 13.分数区间仅限北京"""
 
-    ws.merge_cells('A1:Y1')
-    ws['A1'] = remark_text
-    ws['A1'].alignment = Alignment(wrap_text=True, vertical='top')
-    ws.row_dimensions[1].height = 220
-
     # 第2行：招生年份
     admission_year = ''
-    if conversion_data and len(conversion_data) > 0 and conversion_data[0].get('年份'):
-        admission_year = conversion_data[0]['年份']
-    ws['A2'] = '招生年份'
-    ws['B2'] = admission_year
-
-    # 第3行：表头
-    headers = [
-        '学校名称', '省份', '招生专业', '专业方向（选填）', '专业备注（选填）',
-        '一级层次', '招生科类', '招生批次', '招生类型（选填）', '最高分',
-        '最低分', '平均分', '最低分位次（选填）', '招生人数（选填）',
-        '数据来源', '专业组代码', '首选科目', '选科要求', '次选科目',
-        '专业代码', '招生代码', '最低分数区间低', '最低分数区间高',
-        '最低分数区间位次低', '最低分数区间位次高', '录取人数（选填）'
-    ]
-    for col_idx, header in enumerate(headers, start=1):
-        ws.cell(row=3, column=col_idx, value=header)
-
-    # 数据行
-    for row_idx, row_data in enumerate(data, start=4):
-        for col_idx, header in enumerate(headers, start=1):
-            value = row_data.get(header, '')
-            cell = ws.cell(row=row_idx, column=col_idx, value=value)
-            # 设置代码列为文本格式
-            if header in ['专业组代码', '专业代码', '招生代码']:
-                cell.number_format = numbers.FORMAT_TEXT
-
-    # 设置列宽
-    for col_idx in range(1, len(headers) + 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = 9.36
-
-    wb.save(output_path)
+    if len(conversion_data) > 0:
+        first_row = conversion_data.iloc[0] if isinstance(conversion_data, pd.DataFrame) else conversion_data[0]
+        if first_row.get('年份'):
+            admission_year = first_row['年份']
+
+    # 第1行备注合并A1-Y1；数据行（data 为 convert_data 返回的 DataFrame）代码列为文本格式；列宽统一为9.36
+    write_template_workbook(output_path, data, {
+        'note': remark_text,
+        'note_range': 'A1:Y1',
+        'header_rows': [['招生年份', admission_year]],
+        'columns': MAJOR_SCORE_HEADERS,
+        'text_columns': ['专业组代码', '专业代码', '招生代码'],
+        'column_widths': {openpyxl.utils.get_column_letter(col_idx): 9.36
+                          for col_idx in range(1, len(MAJOR_SCORE_HEADERS) + 1)},
+    })
 
 
 def export_unmatched_major_format(data, output_path):
@@ -2304,6 +2495,20 @@ def export_unmatched_major_format(data, output_path):
     wb.save(output_path)
 
 
+# ============================
+# 结果下载
+# ============================
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def offer_download(data, file_name, label="点击下载处理结果", mime=XLSX_MIME):
+    """
+    以 st.download_button 提供结果下载：data 为内存中的 bytes 或 BytesIO，作为媒体文件直接提供，
+    不做 base64 编码、不嵌入页面，结果也无需先写到磁盘；点击下载不触发页面重新运行，结果区保持显示。
+    """
+    st.download_button(label, data, file_name=file_name, mime=mime, on_click="ignore")
+
+
 # ============================
 # Streamlit页面布局
 # ============================
@@ -2434,22 +2639,17 @@ with tab1:
 
                     # 模拟处理过程，实际使用时替换为您的process_score_file函数
                     if percent_complete == 100:
-                        output_path = process_score_file(temp_file)
+                        output = process_score_file(temp_file, output=BytesIO())
 
                 # 处理完成
                 status_text.text("处理完成！")
                 st.balloons()
 
-                # 提供下载链接
-                with open(output_path, "rb") as f:
-                    bytes_data = f.read()
-                b64 = base64.b64encode(bytes_data).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="院校分提取结果.xlsx">点击下载处理结果</a>'
-                st.markdown(href, unsafe_allow_html=True)
+                # 提供下载（结果在内存中）
+                offer_download(output, "院校分提取结果.xlsx")
 
                 # 清理临时文件
                 os.remove(temp_file)
-                os.remove(output_path)
 
             except Exception as e:
                 st.error(f"处理过程中发生错误: {str(e)}")
@@ -2484,22 +2684,17 @@ with tab2:
 
                     # 调用新模板处理函数
                     if percent_complete == 100:
-                        output_path = process_new_template_file(temp_file)
+                        output = process_new_template_file(temp_file, output=BytesIO())
 
                 # 处理完成
                 status_text.text("处理完成！")
                 st.balloons()
 
-                # 提供下载链接
-                with open(output_path, "rb") as f:
-                    bytes_data = f.read()
-                b64 = base64.b64encode(bytes_data).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="院校分（艺体类）提取结果.xlsx">点击下载处理结果</a>'
-                st.markdown(href, unsafe_allow_html=True)
+                # 提供下载（结果在内存中）
+                offer_download(output, "院校分（艺体类）提取结果.xlsx")
 
                 # 清理临时文件
                 os.remove(temp_file)
-                os.remove(output_path)
 
             except Exception as e:
                 st.error(f"处理过程中发生错误: {str(e)}")
@@ -2514,6 +2709,12 @@ with tab3:
     if uploaded_file is not None:
         st.success(f"已选择文件: {uploaded_file.name}")
 
+        # 执行方式：多进程适合大文件；数据只有一块（几百行以内）或只有一个 CPU 核时始终串行处理
+        executor_labels = {'processes': '多进程（大文件推荐）', 'threads': '多线程', 'serial': '串行'}
+        executor_mode = st.selectbox("执行方式", CHUNK_EXECUTOR_MODES,
+                                     index=CHUNK_EXECUTOR_MODES.index(CHUNK_EXECUTOR_MODE),
+                                     format_func=executor_labels.get, key="remarks_executor_mode")
+
         # 显示处理进度
         progress_bar = st.progress(0)
         status_text = st.empty()
@@ -2536,23 +2737,19 @@ with tab3:
 
 
                 # 处理文件
-                output_path = process_remarks_file(temp_file, progress_callback=update_progress)
+                output = process_remarks_file(temp_file, progress_callback=update_progress,
+                                              executor_mode=executor_mode, output=BytesIO())
 
                 # 处理完成
                 progress_bar.progress(100)
                 status_text.text("处理完成！")
                 st.balloons()
 
-                # 提供下载链接
-                with open(output_path, "rb") as f:
-                    bytes_data = f.read()
-                b64 = base64.b64encode(bytes_data).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="学业桥数据处理结果.xlsx">点击下载处理结果</a>'
-                st.markdown(href, unsafe_allow_html=True)
+                # 提供下载（结果在内存中）
+                offer_download(output, "学业桥数据处理结果.xlsx")
 
                 # 清理临时文件
                 os.remove(temp_file)
-                os.remove(output_path)
 
             except Exception as e:
                 st.error(f"处理过程中发生错误: {str(e)}")
@@ -2587,32 +2784,20 @@ with tab4:
 
                     # 模拟处理过程，实际使用时替换为您的process_segmentation_file函数
                     if percent_complete == 100:
-                        output_path = process_segmentation_file(temp_file)
+                        output = process_segmentation_file(temp_file, output=BytesIO())
 
                 # 处理完成
                 status_text.text("处理完成！")
                 st.balloons()
 
-                # 提供下载链接
-                with open(output_path, "rb") as f:
-                    bytes_data = f.read()
-
-                b64 = base64.b64encode(bytes_data).decode()
-
-                # 从 output_path 提取原文件名（去掉扩展名）
-                base_name = os.path.splitext(os.path.basename(output_path))[0]
-
-                # 拼接新文件名
-                new_filename = f"{base_name}.xlsx"
+                # 下载文件名沿用默认输出文件名（原文件名 + _校验结果）
+                new_filename = os.path.splitext(os.path.basename(temp_file))[0] + "_校验结果.xlsx"
 
-                # 构造下载链接
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="{new_filename}">点击下载处理结果</a>'
-
-                st.markdown(href, unsafe_allow_html=True)
+                # 提供下载（结果在内存中）
+                offer_download(output, new_filename)
 
                 # 清理临时文件
                 os.remove(temp_file)
-                os.remove(output_path)
 
             except Exception as e:
                 st.error(f"处理过程中发生错误: {str(e)}")
@@ -2624,8 +2809,8 @@ with tab5:
     # 初始化session state
     if 'match_result_df' not in st.session_state:
         st.session_state.match_result_df = None
-    if 'manual_fill_records' not in st.session_state:
-        st.session_state.manual_fill_records = []
+    if 'manual_fill_store' not in st.session_state:
+        st.session_state.manual_fill_store = build_manual_fill_store([])
     if 'manual_selections' not in st.session_state:
         st.session_state.manual_selections = {}
     if 'temp_fileA_path' not in st.session_state:
@@ -2725,7 +2910,7 @@ with tab5:
                 result_df, manual_fill_records = process_data(dfA, dfB)
 
                 st.session_state.match_result_df = result_df.copy()
-                st.session_state.manual_fill_records = manual_fill_records
+                st.session_state.manual_fill_store = build_manual_fill_store(manual_fill_records)
                 st.session_state.manual_selections = {}
 
                 status_text.text("处理完成！")
@@ -2753,13 +2938,13 @@ with tab5:
                 st.error(traceback.format_exc())
 
         # 显示手动补充界面（弹框形式）
-        if st.session_state.match_result_df is not None and len(st.session_state.manual_fill_records) > 0:
+        manual_fill_store = st.session_state.manual_fill_store
+        if st.session_state.match_result_df is not None and len(manual_fill_store['order']) > 0:
             st.markdown("---")
             st.subheader("📝 手动补充专业组代码")
             
             # 省份筛选功能
-            all_provinces = sorted(set([r.get("省份", "") for r in st.session_state.manual_fill_records if r.get("省份", "")]))
-            all_provinces = [p for p in all_provinces if p]  # 过滤空值
+            all_provinces = manual_fill_store['provinces']
             
             # 初始化省份筛选
             if 'selected_province' not in st.session_state:
@@ -2779,22 +2964,17 @@ with tab5:
                     st.session_state.current_record_idx = 0
                 st.session_state.selected_province = selected_province
             
-            # 根据省份筛选记录（确保保留所有字段，包括候选记录）
+            # 根据省份筛选记录：直接取该省份的索引列表
             if selected_province == "全部":
-                filtered_records = st.session_state.manual_fill_records
+                filtered_indices = manual_fill_store['order']
             else:
-                # 使用列表推导式筛选，确保保留所有字段
-                filtered_records = []
-                for r in st.session_state.manual_fill_records:
-                    if r.get("省份", "") == selected_province:
-                        # 确保保留完整的记录，包括候选记录字段
-                        filtered_records.append(r)
+                filtered_indices = manual_fill_store['by_province'].get(selected_province, [])
             
             # 显示筛选后的统计信息
             with col2:
-                st.info(f"**筛选结果：** 共 {len(filtered_records)} 条记录需要手动补充（总记录数：{len(st.session_state.manual_fill_records)}）")
+                st.info(f"**筛选结果：** 共 {len(filtered_indices)} 条记录需要手动补充（总记录数：{len(manual_fill_store['order'])}）")
             
-            if len(filtered_records) == 0:
+            if len(filtered_indices) == 0:
                 st.warning(f"⚠️ 省份「{selected_province}」没有需要手动补充的记录")
                 st.stop()
             
@@ -2803,29 +2983,14 @@ with tab5:
                 st.session_state.current_record_idx = 0
             
             # 如果当前索引超出筛选后的记录范围，重置为0
-            if st.session_state.current_record_idx >= len(filtered_records):
+            if st.session_state.current_record_idx >= len(filtered_indices):
                 st.session_state.current_record_idx = 0
             
-            total_records = len(filtered_records)
-            current_record = filtered_records[st.session_state.current_record_idx]
-            idx = current_record["索引"]
+            total_records = len(filtered_indices)
+            idx = filtered_indices[st.session_state.current_record_idx]
+            current_record = manual_fill_store['records'][idx]
             key = f"manual_select_{idx}"
             
-            # 确保从原始记录中获取完整的候选记录信息
-            # 如果筛选后的记录中候选记录丢失或为空，从原始记录中获取
-            candidate_records_from_filtered = current_record.get("候选记录")
-            if candidate_records_from_filtered is None or (isinstance(candidate_records_from_filtered, list) and len(candidate_records_from_filtered) == 0):
-                # 从原始记录中查找对应的记录
-                original_record = next((r for r in st.session_state.manual_fill_records if r.get("索引") == idx), None)
-                if original_record:
-                    original_candidates = original_record.get("候选记录")
-                    if original_candidates is not None:
-                        current_record["候选记录"] = original_candidates
-                    else:
-                        current_record["候选记录"] = []
-                else:
-                    current_record["候选记录"] = []
-            
             # 显示进度
             if selected_province == "全部":
                 progress_text = f"处理进度：{st.session_state.current_record_idx + 1} / {total_records}"
@@ -2847,7 +3012,7 @@ with tab5:
                     st.write(f"**招生批次：** {current_record['招生批次']}")
                     st.write(f"**招生类型：** {current_record['招生类型（选填）']}")
                     # 显示当前已选择的值（如果有）
-                    current_value = st.session_state.manual_selections.get(key, "")
+                    current_value = st.session_state.manual_selections.get(idx, "")
                     if current_value:
                         st.success(f"**已选择：** {current_value}")
                 
@@ -2889,7 +3054,7 @@ with tab5:
                         # 添加"请选择"选项
                         options = ["请选择"] + candidate_options
                         # 获取当前选择（如果有）
-                        current_selection = st.session_state.manual_selections.get(key, "请选择")
+                        current_selection = st.session_state.manual_selections.get(idx, "请选择")
                         default_index = 0
                         if current_selection in options:
                             default_index = options.index(current_selection)
@@ -2902,11 +3067,11 @@ with tab5:
                         )
                         
                         if selected_code != "请选择":
-                            st.session_state.manual_selections[key] = selected_code
+                            st.session_state.manual_selections[idx] = selected_code
                         else:
                             # 如果用户选择了"请选择"，清除之前的选择
-                            if key in st.session_state.manual_selections:
-                                del st.session_state.manual_selections[key]
+                            if idx in st.session_state.manual_selections:
+                                del st.session_state.manual_selections[idx]
                     else:
                         st.warning("⚠️ 候选记录中没有专业组代码，请手动输入")
                         input_key = f"{key}_input"
@@ -2917,9 +3082,9 @@ with tab5:
                             key=input_key
                         )
                         if manual_input and manual_input.strip():
-                            st.session_state.manual_selections[key] = manual_input.strip()
-                        elif key in st.session_state.manual_selections:
-                            del st.session_state.manual_selections[key]
+                            st.session_state.manual_selections[idx] = manual_input.strip()
+                        elif idx in st.session_state.manual_selections:
+                            del st.session_state.manual_selections[idx]
                 else:
                     st.warning("⚠️ 该记录没有候选记录，请手动输入")
                     input_key = f"{key}_input"
@@ -2930,9 +3095,9 @@ with tab5:
                         key=input_key
                     )
                     if manual_input and manual_input.strip():
-                        st.session_state.manual_selections[key] = manual_input.strip()
-                    elif key in st.session_state.manual_selections:
-                        del st.session_state.manual_selections[key]
+                        st.session_state.manual_selections[idx] = manual_input.strip()
+                    elif idx in st.session_state.manual_selections:
+                        del st.session_state.manual_selections[idx]
             
             # 导航按钮
             col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
@@ -2959,19 +3124,9 @@ with tab5:
             col1, col2 = st.columns([1, 1])
             with col1:
                 if st.button("✅ 应用当前选择并继续", type="primary", use_container_width=True):
-                    # 应用当前记录的选择
-                    selected_code = None
-                    if key in st.session_state.manual_selections:
-                        selected_code = st.session_state.manual_selections[key]
-                    elif f"{key}_input" in st.session_state:
-                        input_value = st.session_state[f"{key}_input"]
-                        if input_value and input_value.strip():
-                            selected_code = input_value.strip()
-                    
-                    if selected_code and selected_code.strip():
-                        updated_df = st.session_state.match_result_df.copy()
-                        updated_df.at[idx, "专业组代码"] = selected_code.strip()
-                        st.session_state.match_result_df = updated_df
+                    # 应用当前记录的选择（直接写入匹配结果，不复制整个数据框）
+                    selected_code = st.session_state.manual_selections.get(idx)
+                    if apply_manual_codes(st.session_state.match_result_df, {idx: selected_code}):
                         st.success(f"✅ 已应用记录 {st.session_state.current_record_idx + 1} 的选择：{selected_code.strip()}")
                     
                     # 移动到下一条
@@ -2981,40 +3136,8 @@ with tab5:
             
             with col2:
                 if st.button("✅ 应用所有选择并完成", type="primary", use_container_width=True):
-                    # 更新结果数据框
-                    updated_df = st.session_state.match_result_df.copy()
-                    applied_count = 0
-                    
-                    for record in st.session_state.manual_fill_records:
-                        idx = record["索引"]
-                        key = f"manual_select_{idx}"
-                        input_key = f"{key}_input"
-                        
-                        # 检查是否有选择
-                        selected_code = None
-                        
-                        # 先检查selectbox的选择
-                        if key in st.session_state.manual_selections:
-                            selected_code = st.session_state.manual_selections[key]
-                            if selected_code == "请选择":
-                                selected_code = None
-                        elif key in st.session_state:
-                            selected_code = st.session_state[key]
-                            if selected_code == "请选择":
-                                selected_code = None
-                        
-                        # 如果没有selectbox选择，检查text_input
-                        if not selected_code and input_key in st.session_state:
-                            input_value = st.session_state[input_key]
-                            if input_value and input_value.strip():
-                                selected_code = input_value.strip()
-                        
-                        # 应用选择
-                        if selected_code and selected_code.strip():
-                            updated_df.at[idx, "专业组代码"] = selected_code.strip()
-                            applied_count += 1
-
-                    st.session_state.match_result_df = updated_df
+                    # 所有手动选择（索引 -> 专业组代码）一次性写入匹配结果
+                    applied_count = apply_manual_codes(st.session_state.match_result_df, st.session_state.manual_selections)
                     if applied_count > 0:
                         st.success(f"✅ 已应用 {applied_count} 条记录的手动选择！")
                     else:
@@ -3033,21 +3156,11 @@ with tab5:
             headers = st.session_state.fileA_headers if st.session_state.fileA_headers else list(export_df.columns)
             year_value = st.session_state.fileB_year if st.session_state.fileB_year else ''
             
-            # 导出结果到临时文件
-            temp_output_path = "temp_match_result.xlsx"
+            # 导出结果到内存并提供下载
             try:
-                export_match_result_to_excel(export_df, headers, year_value, temp_output_path)
-                
-                # 读取文件并转换为base64
-                with open(temp_output_path, "rb") as f:
-                    bytes_data = f.read()
-                b64 = base64.b64encode(bytes_data).decode()
-                href = f'<a href="data:application/octet-stream;base64,{b64}" download="专业组代码匹配结果.xlsx">点击下载匹配结果</a>'
-                st.markdown(href, unsafe_allow_html=True)
-                
-                # 清理临时文件
-                if os.path.exists(temp_output_path):
-                    os.remove(temp_output_path)
+                output = BytesIO()
+                export_match_result_to_excel(export_df, headers, year_value, output)
+                offer_download(output, "专业组代码匹配结果.xlsx", label="点击下载匹配结果")
             except Exception as e:
                 st.error(f"导出失败：{str(e)}")
                 import traceback
@@ -3076,30 +3189,33 @@ with tab6:
         if not url:
             st.warning("请输入有效的网页链接")
         else:
-            output_folder = tempfile.mkdtemp()
-            with st.spinner("正在抓取图片..."):
-                try:
-                    image_paths = fetch_images_static(url, output_folder)
-                except Exception as e:
-                    st.error(f"抓取失败: {e}")
-                    image_paths = []
+            # 图片先由本地缓存提供，临时目录只在本次生成预览和 PDF 时使用，用完即删除；
+            # 临时目录建在缓存目录下（同一文件系统），图片以硬链接指向缓存内容，不再复制一份
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=IMAGE_CACHE_DIR) as output_folder:
+                with st.spinner("正在抓取图片..."):
+                    try:
+                        images = fetch_images_static(url, output_folder)
+                    except Exception as e:
+                        st.error(f"抓取失败: {e}")
+                        images = []
 
-            if image_paths:
-                st.success(f"成功提取到 {len(image_paths)} 张图片")
+                if images:
+                    st.success(f"成功提取到 {len(images)} 张图片")
 
-                with st.expander(f"点击查看 {len(image_paths)} 张图片预览", expanded=False):
-                    cols = st.columns(5)
-                    for i, path in enumerate(image_paths):
-                        cols[i % 5].image(path, width=120)
+                    with st.expander(f"点击查看 {len(images)} 张图片预览", expanded=False):
+                        cols = st.columns(5)
+                        for i, (path, digest) in enumerate(images):
+                            cols[i % 5].image(image_thumbnail(digest, path), width=120)
 
-                pdf_path = os.path.join(output_folder, "图片合集.pdf")
-                if images_to_pdf(image_paths, pdf_path):
-                    with open(pdf_path, "rb") as f:
-                        st.download_button("📥 下载合成PDF", f, file_name="就业质量报告.pdf", mime="application/pdf")
+                    pdf_path = os.path.join(output_folder, "图片合集.pdf")
+                    if images_to_pdf([path for path, _ in images], pdf_path):
+                        with open(pdf_path, "rb") as f:
+                            st.download_button("📥 下载合成PDF", f.read(), file_name="就业质量报告.pdf", mime="application/pdf")
+                    else:
+                        st.warning("PDF合成失败")
                 else:
-                    st.warning("PDF合成失败")
-            else:
-                st.warning("未抓取到任何图片")
+                    st.warning("未抓取到任何图片")
 
 
 
@@ -3112,14 +3228,18 @@ with tab7:
     # 初始化session state
     if 'plan_data' not in st.session_state:
         st.session_state.plan_data = None
-    if 'score_data' not in st.session_state:
-        st.session_state.score_data = None
-    if 'college_data' not in st.session_state:
-        st.session_state.college_data = None
+    if 'plan_digest' not in st.session_state:
+        st.session_state.plan_digest = None
+    if 'score_index' not in st.session_state:
+        st.session_state.score_index = None
+    if 'college_index' not in st.session_state:
+        st.session_state.college_index = None
     if 'plan_score_results' not in st.session_state:
-        st.session_state.plan_score_results = []
+        st.session_state.plan_score_results = pd.DataFrame()
     if 'plan_college_results' not in st.session_state:
-        st.session_state.plan_college_results = []
+        st.session_state.plan_college_results = pd.DataFrame()
+    if 'plan_college_match' not in st.session_state:
+        st.session_state.plan_college_match = None
 
     # 工作流步骤显示
     col1, col2, col3, col4, col5 = st.columns([1, 0.3, 1, 0.3, 1])
@@ -3167,6 +3287,8 @@ with tab7:
             try:
                 plan_df = pd.read_excel(plan_file, engine='openpyxl')
                 st.session_state.plan_data = plan_df
+                # 招生计划文件内容哈希：换了文件（即使行数相同）时，已有的比对产物不再复用
+                st.session_state.plan_digest = hashlib.sha256(plan_file.getvalue()).hexdigest()
                 st.success(f"✓ 文件加载成功\n文件名: {plan_file.name}\n记录数: {len(plan_df)} 条")
             except Exception as e:
                 st.error(f"❌ 文件读取失败: {str(e)}")
@@ -3176,9 +3298,9 @@ with tab7:
         score_file = st.file_uploader("上传专业分文件", type=["xlsx", "xls"], key="tab7_score_file")
         if score_file is not None:
             try:
-                score_df = pd.read_excel(score_file, engine='openpyxl')
-                st.session_state.score_data = score_df
-                st.success(f"✓ 文件加载成功\n文件名: {score_file.name}\n记录数: {len(score_df)} 条")
+                # 只保留专业分的组合键索引，相同文件再次上传时直接复用索引
+                st.session_state.score_index = load_plan_key_index(score_file.getvalue(), 'score')
+                st.success(f"✓ 文件加载成功\n文件名: {score_file.name}\n记录数: {st.session_state.score_index['row_count']} 条")
             except Exception as e:
                 st.error(f"❌ 文件读取失败: {str(e)}")
 
@@ -3187,9 +3309,9 @@ with tab7:
         college_file = st.file_uploader("上传院校分文件", type=["xlsx", "xls"], key="tab7_college_file")
         if college_file is not None:
             try:
-                college_df = pd.read_excel(college_file, engine='openpyxl')
-                st.session_state.college_data = college_df
-                st.success(f"✓ 文件加载成功\n文件名: {college_file.name}\n记录数: {len(college_df)} 条")
+                # 只保留院校分的组合键索引，相同文件再次上传时直接复用索引
+                st.session_state.college_index = load_plan_key_index(college_file.getvalue(), 'college')
+                st.success(f"✓ 文件加载成功\n文件名: {college_file.name}\n记录数: {st.session_state.college_index['row_count']} 条")
             except Exception as e:
                 st.error(f"❌ 文件读取失败: {str(e)}")
 
@@ -3210,12 +3332,12 @@ with tab7:
     if compare_plan_score_btn:
         if st.session_state.plan_data is None:
             st.error("请先上传招生计划文件")
-        elif st.session_state.score_data is None:
+        elif st.session_state.score_index is None:
             st.error("请先上传专业分文件")
         else:
             with st.spinner("正在比对数据..."):
                 st.session_state.plan_score_results = compare_plan_vs_score(
-                    st.session_state.plan_data, st.session_state.score_data
+                    st.session_state.plan_data, st.session_state.score_index
                 )
             st.success("比对1完成！")
             st.balloons()
@@ -3223,21 +3345,25 @@ with tab7:
     if compare_plan_college_btn:
         if st.session_state.plan_data is None:
             st.error("请先上传招生计划文件")
-        elif st.session_state.college_data is None:
+        elif st.session_state.college_index is None:
             st.error("请先上传院校分文件")
         else:
             with st.spinner("正在比对数据..."):
+                st.session_state.plan_college_match = match_plan_keys(
+                    st.session_state.plan_data, st.session_state.college_index, PLAN_COLLEGE_KEY_FIELDS,
+                    st.session_state.plan_digest
+                )
                 st.session_state.plan_college_results = compare_plan_vs_college(
-                    st.session_state.plan_data, st.session_state.college_data
+                    st.session_state.plan_data, st.session_state.college_index, st.session_state.plan_college_match
                 )
             st.success("比对2完成！")
             st.balloons()
 
     if compare_all_btn:
         comparisons = []
-        if st.session_state.plan_data is not None and st.session_state.score_data is not None:
+        if st.session_state.plan_data is not None and st.session_state.score_index is not None:
             comparisons.append("比对1")
-        if st.session_state.plan_data is not None and st.session_state.college_data is not None:
+        if st.session_state.plan_data is not None and st.session_state.college_index is not None:
             comparisons.append("比对2")
 
         if len(comparisons) == 0:
@@ -3246,21 +3372,27 @@ with tab7:
             with st.spinner("正在执行全部比对..."):
                 if "比对1" in comparisons:
                     st.session_state.plan_score_results = compare_plan_vs_score(
-                        st.session_state.plan_data, st.session_state.score_data
+                        st.session_state.plan_data, st.session_state.score_index
                     )
                 if "比对2" in comparisons:
+                    st.session_state.plan_college_match = match_plan_keys(
+                        st.session_state.plan_data, st.session_state.college_index, PLAN_COLLEGE_KEY_FIELDS,
+                        st.session_state.plan_digest
+                    )
                     st.session_state.plan_college_results = compare_plan_vs_college(
-                        st.session_state.plan_data, st.session_state.college_data
+                        st.session_state.plan_data, st.session_state.college_index, st.session_state.plan_college_match
                     )
             st.success("全部比对完成！")
             st.balloons()
 
     if reset_btn:
         st.session_state.plan_data = None
-        st.session_state.score_data = None
-        st.session_state.college_data = None
-        st.session_state.plan_score_results = []
-        st.session_state.plan_college_results = []
+        st.session_state.plan_digest = None
+        st.session_state.score_index = None
+        st.session_state.college_index = None
+        st.session_state.plan_score_results = pd.DataFrame()
+        st.session_state.plan_college_results = pd.DataFrame()
+        st.session_state.plan_college_match = None
         st.success("重置完成！")
         st.rerun()
 
@@ -3279,7 +3411,7 @@ with tab7:
             if len(st.session_state.plan_score_results) > 0:
                 results = st.session_state.plan_score_results
                 total = len(results)
-                matched = sum(1 for r in results if r['exists'])
+                matched = count_plan_matched(results)
                 unmatched = total - matched
                 rate = (matched / total * 100) if total > 0 else 0
 
@@ -3298,10 +3430,10 @@ with tab7:
                 st.markdown("### 筛选条件")
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    provinces = sorted(set(r['keyFields']['省份'] for r in results if r['keyFields']['省份']))
+                    provinces = sorted(v for v in results['省份'].unique() if v)
                     province_filter = st.selectbox("省份", ["全部"] + provinces, key="ps_province")
                 with col2:
-                    batches = sorted(set(r['keyFields']['批次'] for r in results if r['keyFields']['批次']))
+                    batches = sorted(v for v in results['批次'].unique() if v)
                     batch_filter = st.selectbox("批次", ["全部"] + batches, key="ps_batch")
                 with col3:
                     match_status_filter = st.selectbox("匹配状态", ["全部", "匹配", "未匹配"], key="ps_status")
@@ -3311,13 +3443,13 @@ with tab7:
                 # 应用筛选
                 filtered_results = results
                 if province_filter != "全部":
-                    filtered_results = [r for r in filtered_results if r['keyFields']['省份'] == province_filter]
+                    filtered_results = filtered_results[filtered_results['省份'] == province_filter]
                 if batch_filter != "全部":
-                    filtered_results = [r for r in filtered_results if r['keyFields']['批次'] == batch_filter]
+                    filtered_results = filtered_results[filtered_results['批次'] == batch_filter]
                 if match_status_filter == "匹配":
-                    filtered_results = [r for r in filtered_results if r['exists']]
+                    filtered_results = filtered_results[filtered_results['exists']]
                 elif match_status_filter == "未匹配":
-                    filtered_results = [r for r in filtered_results if not r['exists']]
+                    filtered_results = filtered_results[~filtered_results['exists']]
 
                 display_count = len(filtered_results)
                 if display_option == "前100条":
@@ -3328,55 +3460,24 @@ with tab7:
                 # 显示表格
                 st.markdown(
                     f"### 比对结果（显示 {min(display_count, len(filtered_results))} / {len(filtered_results)} 条）")
-                display_results = filtered_results[:display_count]
+                display_results = filtered_results.head(display_count)
 
                 if len(display_results) > 0:
                     # 准备表格数据
-                    table_data = []
-                    for r in display_results:
-                        table_data.append({
-                            '序号': r['index'],
-                            '年份': r['keyFields']['年份'],
-                            '省份': r['keyFields']['省份'],
-                            '学校': r['keyFields']['学校'],
-                            '科类': r['keyFields']['科类'],
-                            '批次': r['keyFields']['批次'],
-                            '专业': r['keyFields']['专业'],
-                            '层次': r['keyFields']['层次'],
-                            '专业组代码': r['keyFields']['专业组代码'] or '-',
-                            '招生人数': r['otherInfo']['招生人数'] or '-',
-                            '匹配状态': '✓ 存在' if r['exists'] else '✗ 不存在'
-                        })
-
-                    df_display = pd.DataFrame(table_data)
+                    df_display = build_plan_result_table(
+                        display_results,
+                        ['年份', '省份', '学校', '科类', '批次', '专业', '层次', '专业组代码', '招生人数'],
+                        dash_columns=['专业组代码', '招生人数'],
+                        status_labels=('✓ 存在', '✗ 不存在')
+                    )
                     st.dataframe(df_display, use_container_width=True, hide_index=True)
 
                 # 导出按钮
                 if st.button("导出比对1结果", key="export_ps", use_container_width=True):
                     try:
-                        export_data = []
-                        for r in results:
-                            export_data.append({
-                                '序号': r['index'],
-                                '年份': r['keyFields']['年份'],
-                                '省份': r['keyFields']['省份'],
-                                '学校': r['keyFields']['学校'],
-                                '科类': r['keyFields']['科类'],
-                                '批次': r['keyFields']['批次'],
-                                '专业': r['keyFields']['专业'],
-                                '层次': r['keyFields']['层次'],
-                                '专业组代码': r['keyFields']['专业组代码'],
-                                '招生人数': r['otherInfo']['招生人数'],
-                                '学费': r['otherInfo']['学费'],
-                                '学制': r['otherInfo']['学制'],
-                                '专业代码': r['otherInfo']['专业代码'],
-                                '匹配状态': '存在' if r['exists'] else '不存在',
-                                '匹配说明': '该记录在专业分文件中存在' if r['exists'] else '该记录在专业分文件中不存在'
-                            })
-
                         output = BytesIO()
                         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            pd.DataFrame(export_data).to_excel(writer, index=False, sheet_name='比对1_招生计划vs专业分')
+                            build_plan_score_export(results).to_excel(writer, index=False, sheet_name='比对1_招生计划vs专业分')
 
                         output.seek(0)
                         st.download_button(
@@ -3395,7 +3496,7 @@ with tab7:
             if len(st.session_state.plan_college_results) > 0:
                 results = st.session_state.plan_college_results
                 total = len(results)
-                matched = sum(1 for r in results if r['exists'])
+                matched = count_plan_matched(results)
                 unmatched = total - matched
                 rate = (matched / total * 100) if total > 0 else 0
 
@@ -3414,10 +3515,10 @@ with tab7:
                 st.markdown("### 筛选条件")
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    provinces = sorted(set(r['keyFields']['省份'] for r in results if r['keyFields']['省份']))
+                    provinces = sorted(v for v in results['省份'].unique() if v)
                     province_filter = st.selectbox("省份", ["全部"] + provinces, key="pc_province")
                 with col2:
-                    batches = sorted(set(r['keyFields']['批次'] for r in results if r['keyFields']['批次']))
+                    batches = sorted(v for v in results['批次'].unique() if v)
                     batch_filter = st.selectbox("批次", ["全部"] + batches, key="pc_batch")
                 with col3:
                     match_status_filter = st.selectbox("匹配状态", ["全部", "匹配", "未匹配"], key="pc_status")
@@ -3427,13 +3528,13 @@ with tab7:
                 # 应用筛选
                 filtered_results = results
                 if province_filter != "全部":
-                    filtered_results = [r for r in filtered_results if r['keyFields']['省份'] == province_filter]
+                    filtered_results = filtered_results[filtered_results['省份'] == province_filter]
                 if batch_filter != "全部":
-                    filtered_results = [r for r in filtered_results if r['keyFields']['批次'] == batch_filter]
+                    filtered_results = filtered_results[filtered_results['批次'] == batch_filter]
                 if match_status_filter == "匹配":
-                    filtered_results = [r for r in filtered_results if r['exists']]
+                    filtered_results = filtered_results[filtered_results['exists']]
                 elif match_status_filter == "未匹配":
-                    filtered_results = [r for r in filtered_results if not r['exists']]
+                    filtered_results = filtered_results[~filtered_results['exists']]
 
                 display_count = len(filtered_results)
                 if display_option == "前100条":
@@ -3444,51 +3545,24 @@ with tab7:
                 # 显示表格
                 st.markdown(
                     f"### 比对结果（显示 {min(display_count, len(filtered_results))} / {len(filtered_results)} 条）")
-                display_results = filtered_results[:display_count]
+                display_results = filtered_results.head(display_count)
 
                 if len(display_results) > 0:
                     # 准备表格数据
-                    table_data = []
-                    for r in display_results:
-                        table_data.append({
-                            '序号': r['index'],
-                            '省份': r['keyFields']['省份'],
-                            '学校': r['keyFields']['学校'],
-                            '科类': r['keyFields']['科类'],
-                            '批次': r['keyFields']['批次'],
-                            '专业组代码': r['keyFields']['专业组代码'] or '-',
-                            '招生代码': r['keyFields']['招生代码'] or '-',
-                            '专业': r['otherInfo']['专业'] or '-',
-                            '匹配状态': '✓ 存在' if r['exists'] else '✗ 不存在'
-                        })
-
-                    df_display = pd.DataFrame(table_data)
+                    df_display = build_plan_result_table(
+                        display_results,
+                        ['省份', '学校', '科类', '批次', '专业组代码', '招生代码', '专业'],
+                        dash_columns=['专业组代码', '招生代码', '专业'],
+                        status_labels=('✓ 存在', '✗ 不存在')
+                    )
                     st.dataframe(df_display, use_container_width=True, hide_index=True)
 
                 # 导出按钮
                 if st.button("导出比对2结果", key="export_pc", use_container_width=True):
                     try:
-                        export_data = []
-                        for r in results:
-                            export_data.append({
-                                '序号': r['index'],
-                                '年份': r['otherInfo']['年份'],
-                                '省份': r['keyFields']['省份'],
-                                '学校': r['keyFields']['学校'],
-                                '科类': r['keyFields']['科类'],
-                                '批次': r['keyFields']['批次'],
-                                '专业组代码': r['keyFields']['专业组代码'],
-                                '招生代码': r['keyFields']['招生代码'],
-                                '专业': r['otherInfo']['专业'],
-                                '层次': r['otherInfo']['层次'],
-                                '招生人数': r['otherInfo']['招生人数'],
-                                '匹配状态': '存在' if r['exists'] else '不存在',
-                                '匹配说明': '该记录在院校分文件中存在' if r['exists'] else '该记录在院校分文件中不存在'
-                            })
-
                         output = BytesIO()
                         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            pd.DataFrame(export_data).to_excel(writer, index=False, sheet_name='比对2_招生计划vs院校分')
+                            build_plan_college_export(results).to_excel(writer, index=False, sheet_name='比对2_招生计划vs院校分')
 
                         output.seek(0)
                         st.download_button(
@@ -3507,12 +3581,12 @@ with tab7:
             st.markdown("---")
             st.markdown("### 📤 全局导出功能")
 
-            # 收集所有未匹配的数据
-            all_unmatched_results = []
+            # 统计所有未匹配的数据
+            unmatched_count = 0
             if len(st.session_state.plan_score_results) > 0:
-                all_unmatched_results.extend([r for r in st.session_state.plan_score_results if not r['exists']])
+                unmatched_count += int((~st.session_state.plan_score_results['exists']).sum())
             if len(st.session_state.plan_college_results) > 0:
-                all_unmatched_results.extend([r for r in st.session_state.plan_college_results if not r['exists']])
+                unmatched_count += int((~st.session_state.plan_college_results['exists']).sum())
 
             # 使用三列布局，添加院校分格式导出
             col1, col2, col3 = st.columns([1, 1, 1])
@@ -3524,65 +3598,28 @@ with tab7:
                         with pd.ExcelWriter(output, engine='openpyxl') as writer:
                             # 比对1结果
                             if len(st.session_state.plan_score_results) > 0:
-                                export_data = []
-                                for r in st.session_state.plan_score_results:
-                                    export_data.append({
-                                        '序号': r['index'],
-                                        '年份': r['keyFields']['年份'],
-                                        '省份': r['keyFields']['省份'],
-                                        '学校': r['keyFields']['学校'],
-                                        '科类': r['keyFields']['科类'],
-                                        '批次': r['keyFields']['批次'],
-                                        '专业': r['keyFields']['专业'],
-                                        '层次': r['keyFields']['层次'],
-                                        '专业组代码': r['keyFields']['专业组代码'],
-                                        '招生人数': r['otherInfo']['招生人数'],
-                                        '学费': r['otherInfo']['学费'],
-                                        '学制': r['otherInfo']['学制'],
-                                        '专业代码': r['otherInfo']['专业代码'],
-                                        '匹配状态': '存在' if r['exists'] else '不存在',
-                                        '匹配说明': '该记录在专业分文件中存在' if r['exists'] else '该记录在专业分文件中不存在'
-                                    })
-                                pd.DataFrame(export_data).to_excel(writer, index=False,
-                                                                   sheet_name='比对1_招生计划vs专业分')
+                                build_plan_score_export(st.session_state.plan_score_results).to_excel(
+                                    writer, index=False, sheet_name='比对1_招生计划vs专业分')
 
                             # 比对2结果
                             if len(st.session_state.plan_college_results) > 0:
-                                export_data = []
-                                for r in st.session_state.plan_college_results:
-                                    export_data.append({
-                                        '序号': r['index'],
-                                        '年份': r['otherInfo']['年份'],
-                                        '省份': r['keyFields']['省份'],
-                                        '学校': r['keyFields']['学校'],
-                                        '科类': r['keyFields']['科类'],
-                                        '批次': r['keyFields']['批次'],
-                                        '专业组代码': r['keyFields']['专业组代码'],
-                                        '招生代码': r['keyFields']['招生代码'],
-                                        '专业': r['otherInfo']['专业'],
-                                        '层次': r['otherInfo']['层次'],
-                                        '招生人数': r['otherInfo']['招生人数'],
-                                        '匹配状态': '存在' if r['exists'] else '不存在',
-                                        '匹配说明': '该记录在院校分文件中存在' if r['exists'] else '该记录在院校分文件中不存在'
-                                    })
-                                pd.DataFrame(export_data).to_excel(writer, index=False,
-                                                                   sheet_name='比对2_招生计划vs院校分')
+                                build_plan_college_export(st.session_state.plan_college_results).to_excel(
+                                    writer, index=False, sheet_name='比对2_招生计划vs院校分')
 
                             # 统计报告
+                            score_matched = count_plan_matched(st.session_state.plan_score_results)
+                            college_matched = count_plan_matched(st.session_state.plan_college_results)
                             summary_data = {
                                 '比对类型': ['比对1：招生计划 vs 专业分', '比对2：招生计划 vs 院校分'],
                                 '总记录数': [
                                     len(st.session_state.plan_score_results),
                                     len(st.session_state.plan_college_results)
                                 ],
-                                '匹配记录数': [
-                                    sum(1 for r in st.session_state.plan_score_results if r['exists']),
-                                    sum(1 for r in st.session_state.plan_college_results if r['exists'])
-                                ],
+                                '匹配记录数': [score_matched, college_matched],
                                 '匹配率': [
-                                    f"{(sum(1 for r in st.session_state.plan_score_results if r['exists']) / len(st.session_state.plan_score_results) * 100):.1f}%" if len(
+                                    f"{(score_matched / len(st.session_state.plan_score_results) * 100):.1f}%" if len(
                                         st.session_state.plan_score_results) > 0 else "0%",
-                                    f"{(sum(1 for r in st.session_state.plan_college_results if r['exists']) / len(st.session_state.plan_college_results) * 100):.1f}%" if len(
+                                    f"{(college_matched / len(st.session_state.plan_college_results) * 100):.1f}%" if len(
                                         st.session_state.plan_college_results) > 0 else "0%"
                                 ]
                             }
@@ -3599,14 +3636,14 @@ with tab7:
                         st.error(f"导出失败: {str(e)}")
 
             with col2:
-                if len(all_unmatched_results) > 0:
+                if unmatched_count > 0:
                     if st.button("⭐ 导出未匹配数据为专业分格式", type="primary", use_container_width=True):
                         try:
                             # 提取真正未匹配的原始数据：
                             # - 若两个比对都已执行，则只导出在两次比对中均未匹配的记录（交集）
                             # - 若仅执行其中一次比对，则导出该次比对未匹配的记录
-                            plan_score_unmatched = set(r['originalIndex'] for r in st.session_state.plan_score_results if not r['exists']) if len(st.session_state.plan_score_results) > 0 else set()
-                            plan_college_unmatched = set(r['originalIndex'] for r in st.session_state.plan_college_results if not r['exists']) if len(st.session_state.plan_college_results) > 0 else set()
+                            plan_score_unmatched = unmatched_plan_indices(st.session_state.plan_score_results)
+                            plan_college_unmatched = unmatched_plan_indices(st.session_state.plan_college_results)
 
                             if plan_score_unmatched and plan_college_unmatched:
                                 target_indices = plan_score_unmatched & plan_college_unmatched
@@ -3616,9 +3653,7 @@ with tab7:
                                 target_indices = plan_college_unmatched
 
                             # 去重并按原序输出
-                            conversion_data = []
-                            for idx in sorted(target_indices):
-                                conversion_data.append(st.session_state.plan_data.iloc[idx].to_dict())
+                            conversion_data = st.session_state.plan_data.iloc[sorted(target_indices)]
 
                             # 转换为完整的专业分格式
                             converted_data = convert_data(conversion_data)
@@ -3642,27 +3677,23 @@ with tab7:
                     st.info("暂无未匹配数据")
 
             with col3:
-                if len(all_unmatched_results) > 0:
+                if unmatched_count > 0:
                     if st.button("⭐ 导出未匹配数据为院校分格式", type="primary", use_container_width=True):
                         try:
                             # 检查是否有院校分数据
-                            if 'college_data' not in st.session_state or st.session_state.college_data is None:
+                            if 'college_index' not in st.session_state or st.session_state.college_index is None:
                                 st.error("请先上传院校分文件，以便进行比对过滤")
                             else:
-                                # 提取原始招生计划数据
-                                plan_df = st.session_state.plan_data.copy()
-                                college_df = st.session_state.college_data.copy()
-                                
-                                # 使用新的过滤函数，只导出招生计划中不存在于院校分的数据
-                                unmatched_records = filter_unmatched_plan_data_for_college_export(plan_df, college_df)
+                                # 使用比对2的比对产物按掩码取出招生计划中不存在于院校分的数据
+                                unmatched_df = filter_unmatched_plan_data_for_college_export(
+                                    st.session_state.plan_data, st.session_state.college_index,
+                                    st.session_state.plan_college_match, st.session_state.plan_digest)
                                 
-                                if len(unmatched_records) == 0:
+                                if len(unmatched_df) == 0:
                                     st.warning("⚠️ 所有招生计划数据都已存在于院校分中，无需转换")
                                 else:
-                                    # 提取未匹配数据
-                                    conversion_data = [r['data'] for r in unmatched_records]
-                                    
-                                    # 转换数据为院校分格式
+                                    # 转换数据为院校分格式（转换和导出共用同一份未匹配行，不再转为记录列表）
+                                    conversion_data = unmatched_df
                                     college_score_data = convert_to_college_score_format(conversion_data)
                                     
                                     # 导出
@@ -3763,27 +3794,22 @@ with tab8:
                         status_text = st.empty()
                         status_text.text("处理中...")
                         temp_file = "temp_remark_type.xlsx"
-                        output_path = None
                         try:
                             with open(temp_file, "wb") as f:
                                 f.write(uploaded_bytes)
-                            output_path = process_remark_type_file(temp_file, remark_col, st.session_state.remark_mappings)
+                            output = process_remark_type_file(temp_file, remark_col, st.session_state.remark_mappings,
+                                                              output=BytesIO())
                             progress_bar.progress(100)
                             status_text.text("处理完成！")
                             st.balloons()
 
-                            with open(output_path, "rb") as f:
-                                bytes_data = f.read()
-                            b64 = base64.b64encode(bytes_data).decode()
-                            href = f'<a href="data:application/octet-stream;base64,{b64}" download="备注招生类型提取结果.xlsx">点击下载处理结果</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                            # 提供下载（结果在内存中）
+                            offer_download(output, "备注招生类型提取结果.xlsx")
                         except Exception as e:
                             st.error(f"处理过程中发生错误: {str(e)}")
                         finally:
                             if os.path.exists(temp_file):
                                 os.remove(temp_file)
-                            if output_path and os.path.exists(output_path):
-                                os.remove(output_path)
 
 # 页脚
 st.markdown("---")
@@ -0,0 +1,551 @@
+"""
+学业桥数据处理：学校/专业校验、专业备注校对、分数和选科检查，以及分块（串行/多线程/多进程）执行。
+
+本模块不依赖 Streamlit，也没有导入时的副作用，多进程子进程只需导入本模块即可执行 process_chunk，
+不会重新执行页面脚本 wangye.py。参考数据（有效学校名称、专业组合）由页面加载后通过 set_reference_data 设置。
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import re
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, as_completed
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ======== 参考数据 =========
+VALID_SCHOOL_NAMES = frozenset()
+VALID_MAJOR_COMBOS = frozenset()
+
+
+def set_reference_data(school_names, major_combos):
+    """设置学校名称、专业组合的参考集合（页面加载参考数据后调用，进程池子进程由初始化函数调用）"""
+    global VALID_SCHOOL_NAMES, VALID_MAJOR_COMBOS
+    VALID_SCHOOL_NAMES = school_names
+    VALID_MAJOR_COMBOS = major_combos
+
+
+def check_school_name(name):
+    if pd.isna(name) or not str(name).strip():
+        return '学校名称为空'
+    return '匹配' if name.strip() in VALID_SCHOOL_NAMES else '不匹配'
+
+
+def check_major_combo(major, level):
+    if pd.isna(major) or pd.isna(level):
+        return "数据缺失"
+    combo = f"{str(major).strip()}{str(level).strip()}"
+    return "匹配" if combo in VALID_MAJOR_COMBOS else "不匹配"
+
+
+def check_school_names(names):
+    """check_school_name 的列式版本：整列与 VALID_SCHOOL_NAMES 做 isin 匹配"""
+    stripped = names.fillna('').astype(str).str.strip()
+    result = np.where(stripped.isin(VALID_SCHOOL_NAMES), '匹配', '不匹配').astype(object)
+    result[(names.isna() | (stripped == '')).to_numpy()] = '学校名称为空'
+    return result
+
+
+def check_major_combos(majors, levels):
+    """check_major_combo 的列式版本：专业+层次拼接后与 VALID_MAJOR_COMBOS 做 isin 匹配"""
+    combos = majors.fillna('').astype(str).str.strip() + levels.fillna('').astype(str).str.strip()
+    result = np.where(combos.isin(VALID_MAJOR_COMBOS), '匹配', '不匹配').astype(object)
+    result[(majors.isna() | levels.isna()).to_numpy()] = '数据缺失'
+    return result
+
+
+def convert_selection_requirement_from_requirement(req):
+    """
+    依据上传文件中的报考要求转换为选科要求说明与次选科目（与 docx 规范一致）。
+    1. 报考要求：不限 → 选科要求说明：不限科目专业组，次选科目：空白
+    2. 报考要求仅为单个字（如"化""政"）→ 选科要求说明：单科、多科均需选考，次选科目=报考要求
+    3. 报考要求中包含"且"（如"物且化"、"物且化且生"）→ 选科要求说明：单科、多科均需选考，次选科目为去掉"且"
+    4. 报考要求中包含"或"（如"物或化"、"物或化或生"）→ 选科要求说明：多门选考，次选科目为去掉"或"
+    """
+    if pd.isna(req) or not str(req).strip():
+        return "不限科目专业组", ""
+    s = str(req).strip()
+    if "不限" in s:
+        return "不限科目专业组", ""
+    if len(s) == 1:
+        return "单科、多科均需选考", s
+    if "且" in s:
+        return "单科、多科均需选考", s.replace("且", "")
+    if "或" in s:
+        return "多门选考", s.replace("或", "")
+    return "", ""
+
+
+def convert_selection_requirements(reqs):
+    """convert_selection_requirement_from_requirement 的列式版本，返回（选科要求说明, 次选）两个数组"""
+    s = reqs.fillna('').astype(str).str.strip()
+    conditions = [
+        (reqs.isna() | (s == '') | s.str.contains('不限', regex=False)).to_numpy(),
+        (s.str.len() == 1).to_numpy(),
+        s.str.contains('且', regex=False).to_numpy(),
+        s.str.contains('或', regex=False).to_numpy(),
+    ]
+    desc = np.select(conditions, ['不限科目专业组', '单科、多科均需选考', '单科、多科均需选考', '多门选考'],
+                     default='').astype(object)
+    second = np.select(conditions, [
+        '',
+        s.to_numpy(dtype=object),
+        s.str.replace('且', '', regex=False).to_numpy(dtype=object),
+        s.str.replace('或', '', regex=False).to_numpy(dtype=object),
+    ], default='')
+    return desc, second
+
+
+CUSTOM_WHITELIST = {
+    "宏福校区", "沙河校区", "中外合作办学", "珠海校区", "江北校区", "津南校区", "开封校区",
+    "联合办学", "校企合作", "合作办学", "威海校区", "深圳校区", "苏州校区", "平果校区",
+    "江南校区", "合川校区", "长安校区", "崇安校区", "南校区", "东校区", "都市园艺", "甘肃兰州"
+}
+
+TYPO_DICT = {
+    "教助": "救助",
+    "指辉": "指挥",
+    "料学": "科学",
+    "话言": "语言",
+    "5十3": "5+3",
+    "5十3一体化": "5+3一体化",
+    "“5十3”一体化": "“5+3”一体化",
+    "5+31体化": "5+3一体化",
+    "5+3体化": "5+3一体化",
+    "色言": "色盲",
+    "NIT": "NIIT",
+    "色育": "色盲",
+    "人围": "入围",
+    "项月": "项目",
+    "币范类": "师范类",
+    "投课": "授课",
+    "就薄": "就读",
+    "电请": "申请",
+    "中国面": "中国画",
+    "火数民族": "少数民族",
+    "色自": "色盲",
+    "色盲色弱申报": "色盲色弱慎报",
+    "数学与应用数笑": "数学与应用数学",
+    "法学十": "法学+",
+    "浣海校区": "滨海校区",
+    "中溴": "中澳"
+}
+
+# 所有错别字组成一个备选正则，用于快速判断文本中是否含有错别字：不含时跳过逐个替换。
+# 含有时仍按 TYPO_DICT 的顺序逐个替换，靠前条目替换后产生的文本可被后面的条目继续修正
+# （如"5十31体化"→"5+31体化"→"5+3一体化"，"色言色弱申报"→"色盲色弱申报"→"色盲色弱慎报"）
+TYPO_PATTERN = re.compile('|'.join(re.escape(typo) for typo in TYPO_DICT))
+
+# 各种括号、书名号统一为中文括号
+BRACKET_TRANSLATION = str.maketrans({
+    '{': '（', '[': '（', '【': '（', '<': '（', '《': '（',
+    '}': '）', ']': '）', '】': '）', '>': '）', '》': '）',
+})
+
+REGEX_PATTERNS = {
+    'excess_punct': re.compile(r'[，、。！？；,;.!? ]+'),
+    'outer_punct': re.compile(r'^[，、。！？；,;.!? ]+|[，、。！？；,;.!? ]+$'),
+    'consecutive_right': re.compile(r'）{2,}')
+}
+NESTED_PAREN_PATTERN = re.compile(r'（（(.*?)））')
+CONSECUTIVE_REPEAT_PATTERN = re.compile(r'（(.+?)）\s*（\1）')
+
+
+def similar(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def normalize_brackets(text):
+    """统一各种括号为中文括号并处理不完整括号（结果按原始文本缓存）"""
+    if pd.isna(text) or not str(text).strip():
+        return text
+    return _normalize_brackets_cached(text)
+
+
+def _normalize_brackets(text):
+    # 替换所有括号变体为中文括号（书名号也替换为括号）
+    return str(text).strip().translate(BRACKET_TRANSLATION)
+
+
+def clean_outer_punctuation(text):
+    """清理最外层括号外的标点符号（结果按原始文本缓存）"""
+    if pd.isna(text) or not str(text).strip():
+        return text
+    return _clean_outer_punctuation_cached(text)
+
+
+def _clean_outer_punctuation(text):
+    text = str(text).strip()
+    text = REGEX_PATTERNS['outer_punct'].sub('', text)
+    parts = re.split(r'(（.*?）)', text)
+    cleaned_parts = []
+    for part in parts:
+        if part.startswith('（') and part.endswith('）'):
+            cleaned_parts.append(part)
+        else:
+            cleaned_parts.append(REGEX_PATTERNS['outer_punct'].sub('', part))
+    return ''.join(cleaned_parts)
+
+
+def check_score_consistency(row):
+    """检查分数一致性：最高分 >= 平均分 >= 最低分"""
+    issues = []
+    try:
+        max_score = float(row['最高分']) if pd.notna(row['最高分']) else None
+        avg_score = float(row['平均分']) if pd.notna(row['平均分']) else None
+        min_score = float(row['最低分']) if pd.notna(row['最低分']) else None
+
+        if max_score is not None and avg_score is not None and max_score < avg_score:
+            issues.append(f"最高分({max_score}) < 平均分({avg_score})")
+
+        if max_score is not None and min_score is not None and max_score < min_score:
+            issues.append(f"最高分({max_score}) < 最低分({min_score})")
+
+        if avg_score is not None and min_score is not None and avg_score < min_score:
+            issues.append(f"平均分({avg_score}) < 最低分({min_score})")
+
+    except (ValueError, TypeError) as e:
+        issues.append(f"分数格式错误: {str(e)}")
+
+    return '；'.join(issues) if issues else '无问题'
+
+
+def _parse_score_column(values):
+    """
+    将分数列转换为 float 数组，同时返回每个单元格的转换错误信息（无错误为 None）。
+    先用 pd.to_numeric 批量转换，只有转换失败的非空单元格才逐个用 float() 复核，
+    保证结果和错误信息与 check_score_consistency 中的 float() 完全一致。
+    """
+    nums = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan, copy=True)
+    errors = np.full(len(values), None, dtype=object)
+    unresolved = np.flatnonzero(values.notna().to_numpy() & np.isnan(nums))
+    parsed = {}
+    for pos in unresolved:
+        value = values.iat[pos]
+        key = (type(value), value)
+        if key not in parsed:
+            try:
+                parsed[key] = (float(value), None)
+            except (ValueError, TypeError) as e:
+                parsed[key] = (np.nan, str(e))
+        nums[pos], errors[pos] = parsed[key]
+    return nums, errors
+
+
+def check_score_consistency_columns(max_scores, avg_scores, min_scores):
+    """check_score_consistency 的列式版本：三列一次性比较，输出文字与逐行版本一致"""
+    (max_num, max_err), (avg_num, avg_err), (min_num, min_err) = (
+        _parse_score_column(max_scores), _parse_score_column(avg_scores), _parse_score_column(min_scores))
+    result = np.full(len(max_num), '无问题', dtype=object)
+
+    max_lt_avg = max_num < avg_num
+    max_lt_min = max_num < min_num
+    avg_lt_min = avg_num < min_num
+    for pos in np.flatnonzero(max_lt_avg | max_lt_min | avg_lt_min):
+        max_score, avg_score, min_score = float(max_num[pos]), float(avg_num[pos]), float(min_num[pos])
+        issues = []
+        if max_lt_avg[pos]:
+            issues.append(f"最高分({max_score}) < 平均分({avg_score})")
+        if max_lt_min[pos]:
+            issues.append(f"最高分({max_score}) < 最低分({min_score})")
+        if avg_lt_min[pos]:
+            issues.append(f"平均分({avg_score}) < 最低分({min_score})")
+        result[pos] = '；'.join(issues)
+
+    # 任一分数格式错误时只输出第一个错误（按 最高分、平均分、最低分 的顺序）
+    for errors in (min_err, avg_err, max_err):
+        has_error = np.flatnonzero(pd.notna(errors))
+        result[has_error] = ['分数格式错误: ' + e for e in errors[has_error]]
+    return result
+
+
+def analyze_and_fix(text):
+    """
+    校对专业备注，返回（修正后文本, 问题说明元组）。
+    结果按原始文本缓存，问题说明以元组返回，避免不同行共用同一个可变列表。
+    """
+    if pd.isna(text) or not str(text).strip():
+        return text, ()
+    return _analyze_and_fix_cached(text)
+
+
+def _analyze_and_fix(text):
+    text = normalize_brackets(text)
+    text = clean_outer_punctuation(text)
+    issues = []
+
+    if text in CUSTOM_WHITELIST:
+        return text, ()
+
+    # ========== 括号成对修正 ==========
+    text_list = list(text)
+    stack = []
+    unmatched_right = []
+
+    for i, char in enumerate(text_list):
+        if char == '（':
+            stack.append(i)
+        elif char == '）':
+            if stack:
+                stack.pop()
+            else:
+                unmatched_right.append(i)
+
+    for i in reversed(unmatched_right):
+        del text_list[i]
+        issues.append("删除多余右括号1个")
+
+    if stack:
+        text_list.extend(['）'] * len(stack))
+        issues.append(f"补充缺失右括号{len(stack)}个")
+
+    text = ''.join(text_list)
+
+    # 嵌套修正
+    text, nested_count = NESTED_PAREN_PATTERN.subn(r'（\1）', text)
+    if nested_count > 0:
+        issues.append(f"修复嵌套括号{nested_count}处")
+
+    # ========== 清理空括号或纯标点括号 ==========
+    def clean_empty_paren(m):
+        content = m.group(1).strip('，、,;；:：。！？.!? ')
+        if not content:
+            issues.append("删除空括号或仅含标点括号")
+            return ''
+        return f'（{content}）'
+
+    text = re.sub(r'（(.*?)）', clean_empty_paren, text)
+
+    # ========== 去重 ==========
+    seen = set()
+
+    def dedup(m):
+        c = m.group(1)
+        if c in seen:
+            issues.append(f"重复括号内容：'{c}'")
+            return ''
+        seen.add(c)
+        return f'（{c}）'
+
+    text = re.sub(r'（(.*?)）', dedup, text)
+
+    # ========== 多余标点简化 ==========
+    text = REGEX_PATTERNS['excess_punct'].sub(lambda m: m.group(0)[0], text)
+
+    # ========== 错别字修正 ==========
+    if TYPO_PATTERN.search(text):
+        for typo, corr in TYPO_DICT.items():
+            if typo in text:
+                text = text.replace(typo, corr)
+                issues.append(f"错别字：'{typo}'→'{corr}'")
+
+    return text, tuple(issues)
+
+
+# ======== 备注校对缓存 =========
+# 专业备注重复率很高（如"中外合作办学"），同一原始文本只校对一次。
+# typed=True：避免 1 和 1.0 这类相等但文本不同的值共用缓存结果
+REMARK_CACHE_SIZE = 65536
+
+
+def configure_remark_cache(maxsize=REMARK_CACHE_SIZE):
+    """设置备注校对缓存容量（None 为不限容量），会清空已有缓存和命中计数"""
+    global _remark_cache_size, _normalize_brackets_cached, _clean_outer_punctuation_cached, _analyze_and_fix_cached
+    _remark_cache_size = maxsize
+    _normalize_brackets_cached = lru_cache(maxsize=maxsize, typed=True)(_normalize_brackets)
+    _clean_outer_punctuation_cached = lru_cache(maxsize=maxsize, typed=True)(_clean_outer_punctuation)
+    _analyze_and_fix_cached = lru_cache(maxsize=maxsize, typed=True)(_analyze_and_fix)
+
+
+def get_remark_cache_stats():
+    """返回各备注校对缓存的命中、未命中次数及当前大小"""
+    return {
+        name: func.cache_info()._asdict()
+        for name, func in (
+            ('analyze_and_fix', _analyze_and_fix_cached),
+            ('normalize_brackets', _normalize_brackets_cached),
+            ('clean_outer_punctuation', _clean_outer_punctuation_cached),
+        )
+    }
+
+
+configure_remark_cache(REMARK_CACHE_SIZE)
+
+
+def process_chunk(chunk):
+    """
+    处理数据块。支持上传文件列名与导出列名并存：
+    学校名称/院校名称、招生专业/专业名称、招生科类/科类、选科要求/报考要求。
+    选科转换逻辑与 docx 一致：不限/单字/且/或 → 选科要求说明、次选。
+    """
+    # 学校名称检查（支持 学校名称 或 院校名称）
+    school_col = '学校名称' if '学校名称' in chunk.columns else ('院校名称' if '院校名称' in chunk.columns else None)
+    if school_col:
+        chunk['学校匹配结果'] = check_school_names(chunk[school_col])
+
+    # 专业匹配检查（支持 招生专业 或 专业名称，需有一级层次）
+    major_col = '招生专业' if '招生专业' in chunk.columns else ('专业名称' if '专业名称' in chunk.columns else None)
+    if major_col and '一级层次' in chunk.columns:
+        chunk['招生专业匹配结果'] = check_major_combos(chunk[major_col], chunk['一级层次'])
+
+    # 备注处理（支持 专业备注）
+    remark_col = None
+    for c in chunk.columns:
+        if '专业备注' in str(c):
+            remark_col = c
+            break
+    if remark_col is not None:
+        def process_remark(remark):
+            if pd.isna(remark) or not str(remark).strip():
+                return '无问题', ''
+            fixed_text, issues = analyze_and_fix(remark)
+            return '；'.join(issues) if issues else '无问题', fixed_text
+
+        cache_before = _analyze_and_fix_cached.cache_info()
+        remark_results = [process_remark(x) for x in chunk[remark_col]]
+        cache_after = _analyze_and_fix_cached.cache_info()
+        chunk.attrs['remark_cache'] = (cache_after.hits - cache_before.hits, cache_after.misses - cache_before.misses)
+        chunk['备注检查结果'] = [r[0] for r in remark_results]
+        chunk['修改后备注'] = [r[1] for r in remark_results]
+
+    # 分数检查
+    score_columns = ['最高分', '平均分', '最低分']
+    if all(col in chunk.columns for col in score_columns):
+        chunk['分数检查结果'] = check_score_consistency_columns(chunk['最高分'], chunk['平均分'], chunk['最低分'])
+
+    # 选科要求处理：依据 docx，支持 选科要求 或 报考要求，统一用 convert_selection_requirement_from_requirement
+    req_col = '选科要求' if '选科要求' in chunk.columns else ('报考要求' if '报考要求' in chunk.columns else None)
+    if req_col:
+        chunk['选科要求说明'], chunk['次选'] = convert_selection_requirements(chunk[req_col])
+
+    # 招生科类处理（支持 招生科类 或 科类），统一为物理类/历史类并生成首选科目
+    cat_col = '招生科类' if '招生科类' in chunk.columns else ('科类' if '科类' in chunk.columns else None)
+    if cat_col:
+        chunk['招生科类'] = chunk[cat_col].replace({'物理': '物理类', '历史': '历史类'})
+        categories = chunk['招生科类'].fillna('').astype(str)
+        chunk['首选科目'] = np.select(
+            [categories.str.contains('物理', regex=False).to_numpy(),
+             categories.str.contains('历史', regex=False).to_numpy()],
+            ['物', '历'], default='').astype(object)
+    elif '首选科目' not in chunk.columns and req_col:
+        chunk['首选科目'] = ''
+
+    return chunk
+
+
+# 学业桥分块处理的执行方式：processes（多进程）/ threads（多线程）/ serial（串行）
+# process_chunk 内部均为纯 Python 计算，受 GIL 限制，多线程基本没有加速效果。
+# 多进程不使用 fork（Streamlit 服务端是多线程进程，fork 子进程可能因其他线程持有的锁而死锁），
+# 以 forkserver / spawn 方式启动，子进程只导入本模块（见 _hide_main_script）。
+# 默认执行方式可用环境变量 XUEYEQIAO_EXECUTOR_MODE 设置，页面上也可逐次选择。
+CHUNK_EXECUTOR_MODES = ('processes', 'threads', 'serial')
+CHUNK_EXECUTOR_MODE = os.environ.get('XUEYEQIAO_EXECUTOR_MODE', 'processes')
+MIN_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 20000
+
+
+def _init_chunk_worker(school_names, major_combos, remark_cache_size):
+    """进程池初始化：参考数据只在每个子进程启动时下发一次，不随每个数据块重复序列化"""
+    set_reference_data(school_names, major_combos)
+    if remark_cache_size != _remark_cache_size:
+        configure_remark_cache(remark_cache_size)
+
+
+def _auto_chunk_size(n_rows, workers):
+    """按行数和核数确定块大小：每个工作者约分到 4 块，兼顾负载均衡和进度刷新"""
+    size = -(-n_rows // (max(workers, 1) * 4))
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, size))
+
+
+@contextmanager
+def _hide_main_script():
+    """
+    spawn / forkserver 启动子进程时，会在子进程中按 __main__.__file__ 重新执行主脚本；
+    在 Streamlit 中主脚本就是整个页面脚本 wangye.py（页面调用、参考数据加载都会再执行一遍）。
+    启动子进程期间临时换成不带文件路径的空 __main__，子进程只导入本模块。
+    """
+    main_module = sys.modules.get('__main__')
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main_module
+
+
+def _create_chunk_executor(mode, workers):
+    if mode == 'processes':
+        # 不使用 fork（多线程进程中 fork 不安全）；Windows 不支持 forkserver 时使用 spawn
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        mp_context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # forkserver 预先导入本模块（含 pandas），子进程由它 fork 出来，无需各自重新导入
+            mp_context.set_forkserver_preload([__name__])
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_context,
+            initializer=_init_chunk_worker,
+            initargs=(VALID_SCHOOL_NAMES, VALID_MAJOR_COMBOS, _remark_cache_size)
+        )
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def run_chunks(df, mode=None, progress_callback=None):
+    """
+    分块执行 process_chunk，按原顺序拼接结果。
+    mode 为 None 时使用 CHUNK_EXECUTOR_MODE；数据只有一块或只有一个 CPU 核时直接串行处理。
+    并行执行失败（如子进程异常退出、对象无法序列化）时，剩余数据块退回串行处理。
+    """
+    mode = mode or CHUNK_EXECUTOR_MODE
+    if mode not in CHUNK_EXECUTOR_MODES:
+        raise ValueError(f"不支持的执行方式：{mode}，可选：{CHUNK_EXECUTOR_MODES}")
+    workers = os.cpu_count() or 4
+    chunk_size = _auto_chunk_size(len(df), workers)
+    chunks = [df.iloc[i:i + chunk_size].copy() for i in range(0, len(df), chunk_size)]
+    total_chunks = len(chunks)
+    if total_chunks <= 1 or workers <= 1:
+        mode = 'serial'
+    logging.info(f"学业桥分块处理：{len(df)} 行，{total_chunks} 块，每块 {chunk_size} 行，执行方式 {mode}")
+
+    results = {}
+    cache_before = _analyze_and_fix_cached.cache_info()
+    if mode != 'serial':
+        try:
+            with _create_chunk_executor(mode, min(workers, total_chunks)) as executor:
+                # 子进程在提交数据块时按需启动（块数不少于进程数，提交完成时全部子进程均已启动）
+                with _hide_main_script():
+                    future_to_index = {executor.submit(process_chunk, chunk): idx
+                                       for idx, chunk in enumerate(chunks)}
+                for future in as_completed(future_to_index):
+                    results[future_to_index[future]] = future.result()
+                    if progress_callback:
+                        progress_callback(len(results), total_chunks)
+        except (BrokenExecutor, pickle.PicklingError, OSError) as e:
+            logging.warning(f"{mode} 模式执行失败，剩余数据块改为串行处理：{e}")
+
+    for idx, chunk in enumerate(chunks):
+        if idx in results:
+            continue
+        results[idx] = process_chunk(chunk)
+        if progress_callback:
+            progress_callback(len(results), total_chunks)
+
+    if not results:
+        return df.iloc[0:0]
+    ordered_results = [results[i] for i in range(total_chunks)]
+    chunk_cache_stats = [r.attrs.pop('remark_cache', (0, 0)) for r in ordered_results]
+    if mode == 'processes':
+        # 子进程各有独立缓存，按数据块汇总
+        hits = sum(s[0] for s in chunk_cache_stats)
+        misses = sum(s[1] for s in chunk_cache_stats)
+    else:
+        cache_after = _analyze_and_fix_cached.cache_info()
+        hits, misses = cache_after.hits - cache_before.hits, cache_after.misses - cache_before.misses
+    if hits or misses:
+        logging.info(f"备注校对缓存：命中 {hits} 次，未命中 {misses} 次，命中率 {hits / (hits + misses):.1%}")
+    return pd.concat(ordered_results)